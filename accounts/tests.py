@@ -1,3 +1,22 @@
 from django.test import TestCase
+from django.utils import timezone
 
-# Create your tests here.
+from products.conditional import SETTLE
+from products.models import Menu
+
+
+class MenuListTests(TestCase):
+    def test_not_modified_until_a_menu_changes(self):
+        Menu.objects.create(name='drinks')
+        Menu.objects.update(updated_at=timezone.now() - SETTLE * 2)
+
+        first = self.client.get('/api/menus/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.client.get('/api/menus/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):  # the cached tree is dropped on commit
+            Menu.objects.create(name='desserts')
+        Menu.objects.update(updated_at=timezone.now() - SETTLE * 2)
+        response = self.client.get('/api/menus/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desserts', response.content.decode())
@@ -1,3 +1,5 @@
+import asyncio
+
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
@@ -5,9 +7,9 @@ from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
-from products.models import Menu, Product, Review
+from products import cache as catalogue_cache
+from products.conditional import aconditional_get, menu_etag
 from django.http import JsonResponse
-from django.db.models import Avg
 
 
 # REGISTER VIEW
@@ -54,25 +56,16 @@ class DashboardView(View):
     template_name = "dashboard.html"
     login_url = reverse_lazy('login')
 
-    def get(self, request):
-        # Menus
-        menus = Menu.objects.filter(parent__isnull=True).prefetch_related('children')
-
-        # Recently added products
-        recently_added = Product.objects.order_by('-id')[:8].annotate(avg_rating=Avg('reviews__rating'))
-
-        # for product in recently_added:
-        #     avg = product.reviews.aggregate(average=Avg('rating'))['average']
-        #     product.avg_rating = round(avg or 0, 1)
-
-        # Best sellers (placeholder: using stock as you had)
-        best_sellers = Product.objects.order_by('-stock')[:8].annotate(avg_rating=Avg('reviews__rating'))
-        # for product in best_sellers:
-        #     avg = product.reviews.aggregate(average=Avg('rating'))['average']
-        #     product.avg_rating = round(avg or 0, 1)
-
-        # Recent reviews
-        reviews = Review.objects.select_related('user', 'product').order_by('-id')[:10]
+    async def get(self, request):
+        # Everything on the dashboard comes from the versioned cache; the
+        # fragments (and the session user the templates read) load concurrently
+        menus, recently_added, best_sellers, reviews, request.user = await asyncio.gather(
+            catalogue_cache.amenu_tree(),
+            catalogue_cache.arecent_products(8),
+            catalogue_cache.abest_sellers(days=30, limit=8),
+            catalogue_cache.arecent_reviews(10),
+            request.auser(),
+        )
 
         return render(request, self.template_name, {
             'menus': menus,
@@ -123,19 +116,9 @@ class ProfileView(LoginRequiredMixin, View):
         return redirect("profile")
 
 
-def menu_list_json(request):
+@aconditional_get(menu_etag)
+async def menu_list_json(request):
     """
     Return a JSON response with all top-level menus and their children.
     """
-    menus = Menu.objects.filter(parent__isnull=True).prefetch_related('children')
-    data = []
-
-    for menu in menus:
-        children = [{"id": child.id, "name": child.name} for child in menu.children.all()]
-        data.append({
-            "id": menu.id,
-            "name": menu.name,
-            "children": children
-        })
-
-    return JsonResponse({"menus": data})
\ No newline at end of file
+    return JsonResponse({"menus": await catalogue_cache.amenu_tree()})
\ No newline at end of file
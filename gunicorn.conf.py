@@ -0,0 +1,29 @@
+"""
+Worker layout for production: gunicorn -c gunicorn.conf.py
+
+WEB_WORKER_CLASS=gthread (default) serves sakthi.wsgi with WEB_WORKERS
+processes of WEB_THREADS threads each; uvicorn_worker.UvicornWorker serves
+sakthi.asgi on an event loop per process instead. Each process opens its
+own database pool (see sakthi/settings_production.py), so the app is not
+preloaded into the master.
+"""
+import multiprocessing
+import os
+
+raw_env = [f"DJANGO_SETTINGS_MODULE={os.environ.get('DJANGO_SETTINGS_MODULE', 'sakthi.settings_production')}"]
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+wsgi_app = 'sakthi.asgi:application' if 'Uvicorn' in worker_class else 'sakthi.wsgi:application'
+
+# recycle workers now and then so slow leaks can't build up; jitter avoids restarting them all at once
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-') or None
+errorlog = '-'
@@ -1,14 +1,18 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.utils import timezone
 from .models import (
     Product, Cart, CartItem, Favourite, Review,
-    Order, OrderItem, Shipping, Payment, Menu
+    Order, OrderItem, Shipping, Payment, Menu, ProductSalesDaily, Task, RelatedProduct, StockReservation,
+    OrderStatusChange, IdempotencyKey
 )
+from .fulfilment import InvalidTransition, transition
 
 # ---------- Product ----------
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'price', 'stock')
+    list_display = ('id', 'name', 'price', 'stock', 'reserved')
     search_fields = ('name', 'description')
+    readonly_fields = ('reserved',)  # kept by products.reservations
     list_filter = ('name','price')
     # ordering = ('-created_at',)
 
@@ -51,12 +55,54 @@ class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
 
+class OrderStatusChangeInline(admin.TabularInline):
+    model = OrderStatusChange
+    extra = 0
+    fields = ('created_at', 'from_status', 'to_status', 'changed_by', 'note', 'batch')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'status', 'total_amount')
     search_fields = ('user__username', 'user__email')
     list_filter = ('status',)
-    inlines = [OrderItemInline]
+    # status only moves through the actions (products.fulfilment): checked, restocked and logged
+    readonly_fields = ('status',)
+    inlines = [OrderItemInline, OrderStatusChangeInline]
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'mark_cancelled']
+
+    def _transition(self, request, queryset, status):
+        try:
+            result = transition(queryset.values_list('id', flat=True), status, user=request.user)
+        except InvalidTransition as e:
+            self.message_user(request, str(e), level=messages.ERROR)
+            return
+        self.message_user(request, f"{len(result.changed)} order(s) marked {status}")
+        if result.skipped:
+            self.message_user(
+                request, f"{len(result.skipped)} order(s) can't be marked {status} and were left as they were",
+                level=messages.WARNING,
+            )
+
+    @admin.action(description="Mark selected orders as processing")
+    def mark_processing(self, request, queryset):
+        self._transition(request, queryset, 'processing')
+
+    @admin.action(description="Mark selected orders as shipped")
+    def mark_shipped(self, request, queryset):
+        self._transition(request, queryset, 'shipped')
+
+    @admin.action(description="Mark selected orders as delivered")
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, 'delivered')
+
+    @admin.action(description="Cancel selected orders and restock their items")
+    def mark_cancelled(self, request, queryset):
+        self._transition(request, queryset, 'cancelled')
 
 
 # ---------- Shipping ----------
@@ -73,3 +119,65 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ('id', 'order', 'method', 'status')
     search_fields = ('order__id', 'method')
     list_filter = ('method', 'status')
+
+
+# ---------- Sales rollup ----------
+@admin.register(ProductSalesDaily)
+class ProductSalesDailyAdmin(admin.ModelAdmin):
+    list_display = ('date', 'product', 'quantity', 'revenue')
+    list_filter = ('date',)
+    search_fields = ('product__name',)
+
+
+# ---------- Related products ----------
+@admin.register(RelatedProduct)
+class RelatedProductAdmin(admin.ModelAdmin):
+    list_display = ('product', 'rank', 'related', 'score', 'computed_at')
+    list_select_related = ('product', 'related')
+    search_fields = ('product__name',)
+    raw_id_fields = ('product', 'related')
+
+
+# ---------- Stock reservations ----------
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    # read-only: Product.reserved has to change along with the rows (products.reservations)
+    list_display = ('id', 'holder', 'product', 'quantity', 'expires_at')
+    list_select_related = ('product',)
+    search_fields = ('holder', 'product__name')
+    raw_id_fields = ('product',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# ---------- Task queue ----------
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at')
+    actions = ['retry_now']
+
+    @admin.action(description="Retry selected tasks now")
+    def retry_now(self, request, queryset):
+        updated = queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=timezone.now(), finished_at=None)
+        self.message_user(request, f"{updated} task(s) queued")
+
+
+# ---------- Idempotency keys ----------
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'key', 'status_code', 'created_at', 'expires_at')
+    list_filter = ('status_code',)
+    search_fields = ('key', 'user__username')
+    raw_id_fields = ('user',)
+    readonly_fields = ('fingerprint', 'status_code', 'response', 'created_at')
@@ -2,20 +2,90 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from .models import (
     Product, Cart, CartItem, Favourite,
-    Review, Order, OrderItem, Shipping, Payment
+    Review, Order, Shipping, Payment, Menu
 )
+from .pagination import SORT_KEYS, InvalidCursor, keyset_page, parse_page_size
+from .export import FORMATS, accepts_gzip, agzip_stream, astream, export_queryset, format_since, gzip_stream, parse_since
+from .images import responsive, responsive_many
+from .importer import ProductImporter, is_utf8, read_rows
+from .fulfilment import InvalidTransition, transition
+from .idempotency import idempotent
+from .cart import InvalidOperation, add_items, apply_operations, hold_items
+from .checkout import CartEmpty, OutOfStock, place_order
+from .orders import HISTORY_PAGE_SIZE, history_page
+from .reservations import InsufficientStock, user_holder
+from .sales import WINDOWS, best_sellers
+from .search import search_products
+from .conditional import catalogue_etag, conditional_get, product_etag, product_last_modified
+import io
 from django.db import transaction
 from decimal import Decimal
 
+PRODUCT_FIELDS = (
+    'id', 'sku', 'name', 'price', 'stock', 'description', 'image', 'menu_id',
+    'rating_avg', 'rating_count',
+)
+
+
 # --- PRODUCTS ---
+@conditional_get(etag_func=catalogue_etag)
 class ProductListView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request):
-        products = Product.objects.all().values()
-        return Response(list(products))
+        """
+        Keyset-paginated product list.
+        ?sort=id|-id|price|-price|name|-name|rating|-rating  ?limit=50  ?cursor=<next>
+        ?fields=id,name,price  ?menu=<id> (includes submenus)  ?min_rating=4
+        With the image field, each row also gets 'images': {src, width, height,
+        srcset: {webp, jpeg}} pointing at the resized derivatives.
+        """
+        sort = request.query_params.get('sort', 'id')
+        if sort not in SORT_KEYS:
+            return Response({'error': f'Invalid sort, use one of {", ".join(SORT_KEYS)}'}, status=400)
+
+        fields = PRODUCT_FIELDS
+        if request.query_params.get('fields'):
+            fields = [f.strip() for f in request.query_params['fields'].split(',') if f.strip()]
+            unknown = set(fields) - set(PRODUCT_FIELDS)
+            if unknown:
+                return Response({'error': f'Unknown fields: {", ".join(sorted(unknown))}'}, status=400)
+
+        products = Product.objects.all()
+        menu_id = request.query_params.get('menu')
+        if menu_id:
+            if not menu_id.isdigit():
+                return Response({'error': 'Invalid menu'}, status=400)
+            products = products.filter(menu_id__in=Menu.subtree_ids(int(menu_id)))
+        min_rating = request.query_params.get('min_rating')
+        if min_rating:
+            try:
+                products = products.filter(rating_avg__gte=float(min_rating))
+            except ValueError:
+                return Response({'error': 'Invalid min_rating'}, status=400)
+
+        try:
+            rows, next_cursor = keyset_page(
+                products, fields,
+                sort=sort,
+                cursor=request.query_params.get('cursor'),
+                limit=parse_page_size(request.query_params.get('limit')),
+            )
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=400)
+
+        if 'image' in fields:
+            images = responsive_many(row['image'] for row in rows)
+            for row in rows:
+                info = images.get(row['image'])
+                row['images'] = info.as_dict() if info else None
+
+        return Response({'results': rows, 'next': next_cursor})
 
     def post(self, request):
         name = request.data.get('name')
@@ -32,17 +102,147 @@ class ProductListView(APIView):
         return Response({'id': product.id, 'message': 'Product created'}, status=201)
 
 
+class ProductExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        """
+        Stream the whole catalogue (or rows changed after ?since=) as
+        ?output=ndjson|csv. Gzipped when the client accepts it or ?gzip=1.
+        X-Export-Timestamp is the value to pass as ?since= next time.
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in FORMATS:
+            return Response({'error': f'Invalid output, use one of {", ".join(FORMATS)}'}, status=400)
+
+        since = None
+        if request.query_params.get('since'):
+            since = parse_since(request.query_params['since'])
+            if since is None:
+                return Response({'error': 'Invalid since, use an ISO-8601 date or datetime'}, status=400)
+
+        started = timezone.now()
+        stream, content_type, ext = FORMATS[output]
+        use_gzip = (request.query_params.get('gzip') == '1'
+                    or accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING', '')))
+        # each server streams its own kind of iterator; given the other, Django buffers it all.
+        # Only an ASGI request carries a scope.
+        if getattr(request, 'scope', None) is not None:
+            chunks = astream(stream, export_queryset(since, asynchronous=True))
+            if use_gzip:
+                chunks = agzip_stream(chunks)
+        else:
+            chunks = stream(export_queryset(since))
+            if use_gzip:
+                chunks = gzip_stream(chunks)
+
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{ext}"'
+        response['X-Export-Timestamp'] = format_since(started)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+
+class ProductImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        """
+        Bulk upsert products keyed on sku from an uploaded ``file``
+        (?input=csv|ndjson, default from the file name). ?chunk_size=1000
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'file required'}, status=400)
+
+        fmt = request.query_params.get('input')
+        if fmt is None:
+            fmt = 'csv' if upload.name.endswith('.csv') else 'ndjson'
+        if fmt not in ('csv', 'ndjson'):
+            return Response({'error': 'Invalid input, use csv or ndjson'}, status=400)
+
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', 1000))
+        except ValueError:
+            chunk_size = 0
+        if not 1 <= chunk_size <= 10000:
+            return Response({'error': 'chunk_size must be between 1 and 10000'}, status=400)
+
+        # checked before anything is written: chunks commit as they go
+        if not is_utf8(upload):
+            return Response({'error': 'File must be UTF-8'}, status=400)
+        stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+        result = ProductImporter(chunk_size=chunk_size).run(read_rows(stream, fmt))
+        return Response(result.as_dict(), status=200)
+
+
+class ProductSearchView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        """?q=<text> ?menu=<id> (includes submenus) ?limit=20"""
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return Response({'error': 'q required'}, status=400)
+        menu_ids = None
+        menu_id = request.query_params.get('menu')
+        if menu_id:
+            if not menu_id.isdigit():
+                return Response({'error': 'Invalid menu'}, status=400)
+            menu_ids = Menu.subtree_ids(int(menu_id))
+
+        products, facets = search_products(q, menu_ids, limit=parse_page_size(request.query_params.get('limit')))
+        return Response({
+            'results': [
+                {'id': p.id, 'name': p.name, 'price': p.price, 'menu_id': p.menu_id,
+                 'rating_avg': p.rating_avg, 'rank': getattr(p, 'rank', None)}
+                for p in products
+            ],
+            'facets': [
+                {'menu_id': f['menu_id'], 'menu': f['menu__name'], 'count': f['count']}
+                for f in facets
+            ],
+        })
+
+
+class BestSellersView(APIView):
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        """?days=7|30|90 (default 30) ?limit=8"""
+        try:
+            days = int(request.query_params.get('days', 30))
+            limit = min(int(request.query_params.get('limit', 8)), 50)
+        except ValueError:
+            return Response({'error': 'days and limit must be integers'}, status=400)
+        if days not in WINDOWS:
+            return Response({'error': f'days must be one of {", ".join(map(str, WINDOWS))}'}, status=400)
+        return Response([
+            {'id': p.id, 'name': p.name, 'price': p.price, 'units_sold': p.units_sold}
+            for p in best_sellers(days, limit)
+        ])
+
+
+@conditional_get(etag_func=product_etag, last_modified_func=product_last_modified)
 class ProductDetailView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, pk):
         product = get_object_or_404(Product, pk=pk)
+        images = responsive(product.image) if product.image else None
         return Response({
             'id': product.id,
             'name': product.name,
             'price': product.price,
             'stock': product.stock,
-            'description': product.description
+            'description': product.description,
+            'image': product.image.name or None,
+            'images': images.as_dict() if images else None,
+            'rating_avg': product.rating_avg,
+            'rating_count': product.rating_count,
+            'rating_histogram': dict(product.rating_histogram),
         })
 
 
@@ -52,35 +252,68 @@ class CartView(APIView):
 
     def get(self, request):
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        items = CartItem.objects.filter(cart=cart).select_related('product')
-        return Response({
-            'cart_id': cart.id,
-            'items': [
-                {
-                    'id': i.id,
-                    'product_id': i.product.id,
-                    'product_name': i.product.name,
-                    'quantity': i.quantity
-                } for i in items
-            ]
-        })
+        return Response(_cart_payload(cart))
 
     def post(self, request):
-        """Add item to cart"""
+        """
+        Add item to cart: one INSERT ... ON CONFLICT DO UPDATE SET quantity = quantity + n,
+        then hold the new quantity (409 if there isn't enough left)
+        """
         product_id = request.data.get('product_id')
-        quantity = int(request.data.get('quantity', 1))
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return Response({'error': 'quantity must be an integer'}, status=400)
+        if quantity < 1:
+            return Response({'error': 'quantity must be at least 1'}, status=400)
+        product = get_object_or_404(Product.objects.only('id'), id=product_id)
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        product = get_object_or_404(Product, id=product_id)
-        item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product,
-            defaults={'quantity': quantity}
-        )
-        if not created:
-            item.quantity += quantity
-            item.save()
+        try:
+            with transaction.atomic():
+                add_items(cart.id, {product.id: quantity})
+                hold_items(cart.id, user_holder(request.user), [product.id])
+        except InsufficientStock as e:
+            return Response({'error': 'Insufficient stock', 'lines': [e.line]}, status=409)
         return Response({'message': 'Added to cart'})
 
 
+class CartBatchView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """
+        Apply several cart changes in one transaction, e.g. coalesced clicks:
+        {"operations": [{"op": "add", "product_id": 1, "quantity": 2},
+                        {"op": "set", "product_id": 2, "quantity": 5},
+                        {"op": "remove", "product_id": 3}]}
+        Operations apply in order; returns the resulting cart. The resulting
+        quantities are held for checkout; 409 and nothing changes if one can't be.
+        """
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            apply_operations(cart.id, request.data.get('operations'), user_holder(request.user))
+        except InvalidOperation as e:
+            return Response({'error': str(e)}, status=400)
+        except InsufficientStock as e:
+            return Response({'error': 'Insufficient stock', 'lines': [e.line]}, status=409)
+        return Response(_cart_payload(cart))
+
+
+def _cart_payload(cart):
+    items = CartItem.objects.filter(cart=cart).select_related('product').order_by('id')
+    return {
+        'cart_id': cart.id,
+        'items': [
+            {
+                'id': i.id,
+                'product_id': i.product.id,
+                'product_name': i.product.name,
+                'quantity': i.quantity
+            } for i in items
+        ]
+    }
+
+
 # --- FAVOURITES ---
 class FavouriteView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -136,52 +369,62 @@ class OrderListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        orders = Order.objects.filter(user=request.user)
-        return Response([
-            {
-                'id': o.id,
-                'status': o.status,
-                'total_amount': o.total_amount,
-                'created_at': o.created_at
-            } for o in orders
-        ])
+        """
+        The user's orders, newest first, from the OrderSummary snapshot.
+        ?limit=20  ?cursor=<next from the previous page>
+        """
+        limit = parse_page_size(request.query_params.get('limit') or HISTORY_PAGE_SIZE)
+        try:
+            summaries, next_cursor = history_page(request.user, request.query_params.get('cursor'), limit)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=400)
+        images = responsive_many(s.first_item_image for s in summaries)
+        return Response({
+            'results': [
+                {
+                    'id': s.order_id,
+                    'status': s.status,
+                    'total_amount': s.total_amount,
+                    'created_at': s.created_at,
+                    'line_count': s.line_count,
+                    'unit_count': s.unit_count,
+                    'first_item_name': s.first_item_name,
+                    'first_item_images': images[s.first_item_image].as_dict()
+                    if s.first_item_image in images else None,
+                    'payment_method': s.payment_method or None,
+                    'payment_status': s.payment_status or None,
+                    'shipping_status': s.shipping_status,
+                } for s in summaries
+            ],
+            'next': next_cursor,
+        })
 
-    @transaction.atomic
+    @idempotent
     def post(self, request):
-        """Create order from cart items"""
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        items = CartItem.objects.filter(cart=cart).select_related('product')
-        if not items:
+        """Create order from cart items; send an Idempotency-Key header to make retries safe"""
+        try:
+            order = place_order(request.user)
+        except CartEmpty:
             return Response({'error': 'Cart is empty'}, status=400)
-
-        total = sum([i.product.price * i.quantity for i in items])
-        order = Order.objects.create(user=request.user, total_amount=total)
-
-        for i in items:
-            OrderItem.objects.create(
-                order=order,
-                product=i.product,
-                quantity=i.quantity,
-                price=i.product.price
-            )
-            # reduce stock
-            i.product.stock -= i.quantity
-            i.product.save()
-
-        items.delete()  # clear cart
-        return Response({'order_id': order.id, 'total': total})
+        except OutOfStock as e:
+            return Response({'error': 'Insufficient stock', 'lines': e.lines}, status=409)
+        return Response({'order_id': order.id, 'total': order.total_amount})
 
 
 class OrderDetailView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, pk):
-        order = get_object_or_404(Order, id=pk, user=request.user)
-        items = order.items.select_related('product')
+        order = get_object_or_404(Order.objects.select_related('summary'), id=pk, user=request.user)
+        items = order.items.select_related('product').only('quantity', 'price', 'product__name')
+        summary = getattr(order, 'summary', None)
         return Response({
             'id': order.id,
             'status': order.status,
             'total_amount': order.total_amount,
+            'created_at': order.created_at,
+            'payment_status': (summary.payment_status or None) if summary else None,
+            'shipping_status': summary.shipping_status if summary else None,
             'items': [
                 {
                     'product': it.product.name,
@@ -196,6 +439,7 @@ class OrderDetailView(APIView):
 class ShippingView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, order_id):
         order = get_object_or_404(Order, id=order_id, user=request.user)
         data = request.data
@@ -219,6 +463,7 @@ class ShippingView(APIView):
 class PaymentView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request, order_id):
         order = get_object_or_404(Order, id=order_id, user=request.user)
         method = request.data.get('method', 'cod')
@@ -227,3 +472,27 @@ class PaymentView(APIView):
             defaults={'method': method, 'status': 'pending'}
         )
         return Response({'message': 'Payment initiated'})
+
+
+# --- FULFILMENT ---
+class FulfilmentBatchView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        """
+        Move many orders to one status in a single set-based update:
+        {"order_ids": [1, 2, 3], "status": "shipped", "note": "van 4"}
+        Orders that can't make that move (wrong status, no shipping details
+        for "shipped") are left alone and listed under "skipped".
+        """
+        order_ids = request.data.get('order_ids')
+        if not isinstance(order_ids, list) or not order_ids or not all(type(i) is int for i in order_ids):
+            return Response({'error': 'order_ids must be a non-empty list of integers'}, status=400)
+        note = request.data.get('note') or ''
+        if not isinstance(note, str) or len(note) > 255:
+            return Response({'error': 'note must be a string of at most 255 characters'}, status=400)
+        try:
+            result = transition(order_ids, request.data.get('status'), user=request.user, note=note)
+        except InvalidTransition as e:
+            return Response({'error': str(e)}, status=400)
+        return Response(result.as_dict())
@@ -0,0 +1,23 @@
+from django.urls import path
+from .api import (
+    ProductListView, ProductExportView, ProductImportView, ProductSearchView, BestSellersView, ProductDetailView, CartView, CartBatchView, FavouriteView, ReviewView,
+    OrderListView, OrderDetailView, ShippingView, PaymentView, FulfilmentBatchView
+)
+
+urlpatterns = [
+    path('products/', ProductListView.as_view(), name='api_products'),
+    path('products/export/', ProductExportView.as_view(), name='api_products_export'),
+    path('products/import/', ProductImportView.as_view(), name='api_products_import'),
+    path('products/search/', ProductSearchView.as_view(), name='api_product_search'),
+    path('products/best-sellers/', BestSellersView.as_view(), name='api_best_sellers'),
+    path('products/<int:pk>/', ProductDetailView.as_view(), name='api_product_detail'),
+    path('products/<int:product_id>/reviews/', ReviewView.as_view(), name='api_reviews'),
+    path('cart/', CartView.as_view(), name='api_cart'),
+    path('cart/batch/', CartBatchView.as_view(), name='api_cart_batch'),
+    path('favourites/', FavouriteView.as_view(), name='api_favourites'),
+    path('orders/', OrderListView.as_view(), name='api_orders'),
+    path('orders/<int:pk>/', OrderDetailView.as_view(), name='api_order_detail'),
+    path('orders/<int:order_id>/shipping/', ShippingView.as_view(), name='api_shipping'),
+    path('orders/<int:order_id>/payment/', PaymentView.as_view(), name='api_payment'),
+    path('fulfilment/batches/', FulfilmentBatchView.as_view(), name='api_fulfilment_batch'),
+]
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
+
+
+def create_search_extensions(sender, using, **kwargs):
+    # the trigram index on Product.name needs pg_trgm before the products tables are migrated
+    from django.db import connections
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import cache, cart, menus, orders, search  # noqa: F401 -- registers the cache/cart/menu/order/search receivers
+        pre_migrate.connect(create_search_extensions, sender=self)
@@ -0,0 +1,73 @@
+"""Helpers shared by the benchmark management commands."""
+import random
+import statistics
+import subprocess
+import time
+from decimal import Decimal
+
+from .models import Product
+
+WORDS = (
+    'agarbatti sambrani dhoop camphor kumkum turmeric sandal rose jasmine lavender '
+    'mogra kewda lotus temple pooja diya brass copper wick ghee oil cotton cone '
+    'stick premium natural herbal organic gift pack box cup holder stand lamp '
+    'bell incense fragrance guggal loban musk amber vetiver tulsi neem saffron'
+).split()
+
+
+def percentiles(samples):
+    """latency summary in milliseconds"""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(p):
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        'n': len(ordered),
+        'mean': round(statistics.fmean(ordered) * 1000, 3),
+        'p50': pick(50),
+        'p95': pick(95),
+        'p99': pick(99),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - started
+
+
+def git_commit():
+    """short hash of the checked-out commit, to tag benchmark reports"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def product_name(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+
+
+def synthetic_products(start, count, menu_ids, seed=0):
+    """``count`` unsaved products with skus bench-<start>... and random names"""
+    rng = random.Random(seed + start)
+    for n in range(start, start + count):
+        yield Product(
+            sku=f'bench-{n}',
+            name=product_name(rng),
+            description=' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 30))),
+            price=Decimal(rng.randint(500, 500000)) / 100,
+            stock=rng.randint(0, 500),
+            menu_id=rng.choice(menu_ids) if menu_ids else None,
+        )
+
+
+def misspell(word, rng):
+    if len(word) < 5:
+        return word
+    i = rng.randrange(1, len(word) - 1)
+    return word[:i] + word[i + 1:]
@@ -0,0 +1,187 @@
+"""
+Versioned cache for the catalogue.
+
+Every cached fragment key embeds the current version of the tables it was
+built from ('menu', 'product', 'review'). Saving or deleting a row
+bumps that table's version, so stale entries are never read again and simply
+age out of the cache; nothing has to be deleted explicitly.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .menus import product_counts
+from .models import Menu, Product, Review
+
+FRAGMENT_TTL = 60 * 60
+# the menu tree carries product counts, which adding or removing products doesn't
+# invalidate (a 'product' bump comes with every checkout): they may lag this long
+MENU_TREE_TTL = 10 * 60
+
+
+def _version_key(name):
+    return f'ver:{name}'
+
+
+def versions(*names):
+    """Current version of each table, in one cache round trip."""
+    keys = [_version_key(n) for n in names]
+    found = cache.get_many(keys)
+    missing = [k for k in keys if k not in found]
+    if missing:
+        # start from a timestamp so a restarted cache never reuses old versions
+        start = int(time.time() * 1000)
+        for key in missing:
+            cache.add(key, start, None)
+        found.update(cache.get_many(missing))
+    return tuple(found.get(k, 0) for k in keys)
+
+
+async def aversions(*names):
+    keys = [_version_key(n) for n in names]
+    found = await cache.aget_many(keys)
+    missing = [k for k in keys if k not in found]
+    if missing:
+        start = int(time.time() * 1000)
+        for key in missing:
+            await cache.aadd(key, start, None)
+        found.update(await cache.aget_many(missing))
+    return tuple(found.get(k, 0) for k in keys)
+
+
+def bump(*names):
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:
+            cache.set(_version_key(name), int(time.time() * 1000), None)
+
+
+def bump_on_commit(*names):
+    transaction.on_commit(lambda: bump(*names))
+
+
+def cached(name, depends_on, build, ttl=FRAGMENT_TTL):
+    """Return the cached fragment ``name`` for the current ``depends_on`` versions, building it on a miss."""
+    key = f'frag:{name}:' + ':'.join(map(str, versions(*depends_on)))
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, ttl)
+    return value
+
+
+async def acached(name, depends_on, build, ttl=FRAGMENT_TTL):
+    """cached() for async views; ``build`` is a coroutine function"""
+    key = f'frag:{name}:' + ':'.join(map(str, await aversions(*depends_on)))
+    value = await cache.aget(key)
+    if value is None:
+        value = await build()
+        await cache.aset(key, value, ttl)
+    return value
+
+
+# --- Fragments ---
+def _image_url(image):
+    return image.url if image else ''
+
+
+def _menu_dicts(menus, counts):
+    return [
+        {
+            'id': menu.id,
+            'name': menu.name,
+            'image': menu.image.name or '',
+            'image_url': _image_url(menu.image),
+            'product_count': counts.get(menu.id, 0),  # including all submenus
+            'children': [
+                {'id': child.id, 'name': child.name, 'image': child.image.name or '',
+                 'image_url': _image_url(child.image), 'product_count': counts.get(child.id, 0)}
+                for child in menu.children.all()
+            ],
+        }
+        for menu in menus
+    ]
+
+
+def _top_menus():
+    return Menu.objects.filter(parent__isnull=True).prefetch_related('children')
+
+
+def _build_menu_tree():
+    return _menu_dicts(_top_menus(), product_counts())
+
+
+async def _abuild_menu_tree():
+    menus = [menu async for menu in _top_menus().aiterator(chunk_size=100)]
+    return _menu_dicts(menus, await sync_to_async(product_counts)())
+
+
+def menu_tree():
+    """Top-level menus as plain dicts with their children and product counts"""
+    return cached('menu_tree', ['menu'], _build_menu_tree, ttl=MENU_TREE_TTL)
+
+
+def recent_products(limit=8):
+    return cached(
+        f'recent_products:{limit}', ['product', 'review'],
+        lambda: list(Product.objects.order_by('-id')[:limit]),
+    )
+
+
+def best_sellers(days=30, limit=8):
+    # products.sales caches the ranking against the rollup's own watermark (the
+    # task workers write the rollup); the few products are read by id each time
+    from .sales import best_sellers as build
+    return build(days, limit)
+
+
+def recent_reviews(limit=10):
+    return cached(
+        f'recent_reviews:{limit}', ['review', 'product'],
+        lambda: list(Review.objects.select_related('user', 'product').order_by('-id')[:limit]),
+    )
+
+
+# Async counterparts for the ASGI views: same keys, so sync and async views share entries
+async def amenu_tree():
+    return await acached('menu_tree', ['menu'], _abuild_menu_tree, ttl=MENU_TREE_TTL)
+
+
+async def arecent_products(limit=8):
+    async def build():
+        return [p async for p in Product.objects.order_by('-id')[:limit].aiterator()]
+    return await acached(f'recent_products:{limit}', ['product', 'review'], build)
+
+
+async def abest_sellers(days=30, limit=8):
+    from .sales import best_sellers as build
+    return await sync_to_async(build)(days, limit)
+
+
+async def arecent_reviews(limit=10):
+    async def build():
+        queryset = Review.objects.select_related('user', 'product').order_by('-id')[:limit]
+        return [r async for r in queryset.aiterator()]
+    return await acached(f'recent_reviews:{limit}', ['review', 'product'], build)
+
+
+# --- Invalidation ---
+@receiver([post_save, post_delete], sender=Menu)
+def menu_changed(sender, **kwargs):
+    bump_on_commit('menu')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, **kwargs):
+    bump_on_commit('product')
+
+
+@receiver([post_save, post_delete], sender=Review)
+def review_changed(sender, **kwargs):
+    # also covers the rating fields the Review receivers update on Product
+    bump_on_commit('review')
@@ -0,0 +1,318 @@
+"""
+Session-backed working cart.
+
+The cart lives in the session as compact {"<product id>": quantity} pairs,
+so adding, updating and removing items never touch the cart tables and
+anonymous visitors get a cart too. A logged-in user's Cart/CartItem rows are
+read once per session and written back only when it matters: at login (the
+anonymous cart is merged in), at logout and at checkout.
+
+Every quantity change also holds the units (products.reservations), so a
+product can't be added beyond what is left to sell.
+
+The API edits the saved cart directly with single-statement upserts; see
+apply_operations for the batch endpoint.
+"""
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import connection, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Cart, CartItem, Product
+from .reservations import hold, new_token, release, session_holder, transfer, user_holder
+
+SESSION_KEY = 'cart'
+MAX_QUANTITY = 999
+
+
+class CartLine:
+    __slots__ = ('product', 'quantity')
+
+    def __init__(self, product, quantity):
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def subtotal(self):
+        return self.product.price * self.quantity
+
+
+def stored_items(user):
+    """{product_id: quantity} from the user's saved cart(s), in one query"""
+    items = {}
+    for product_id, qty in CartItem.objects.filter(cart__user=user).values_list('product_id', 'quantity'):
+        items[str(product_id)] = items.get(str(product_id), 0) + qty
+    return items
+
+
+class SessionCart:
+    def __init__(self, request, user=None):
+        user = user or getattr(request, 'user', None)
+        self.session = request.session
+        self.user = user if user is not None and user.is_authenticated else None
+        owner = self.user.id if self.user else None
+        data = self.session.get(SESSION_KEY)
+        if data is None or data['owner'] != owner:
+            data = self._adopt(data, owner)
+            self.session[SESSION_KEY] = data
+        self.data = data
+
+    def _adopt(self, data, owner):
+        if owner is None:
+            return {'owner': None, 'items': {}, 'dirty': False}
+        items = stored_items(self.user)
+        dirty = False
+        if data and data['owner'] is None and data['items']:
+            # anonymous cart carried over the login: add it to the saved one, holds too
+            for product_id, qty in data['items'].items():
+                items[product_id] = min(items.get(product_id, 0) + qty, MAX_QUANTITY)
+            if data.get('holder'):
+                transfer(session_holder(data['holder']), user_holder(self.user))
+            dirty = True
+        return {'owner': owner, 'items': items, 'dirty': dirty}
+
+    @property
+    def holder(self):
+        """who the stock holds of this cart belong to"""
+        if self.user is not None:
+            return user_holder(self.user)
+        if 'holder' not in self.data:
+            self.data['holder'] = new_token()
+            self.session.modified = True
+        return session_holder(self.data['holder'])
+
+    # --- Reading ---
+    @property
+    def items(self):
+        """{product_id: quantity}"""
+        return {int(pid): qty for pid, qty in self.data['items'].items()}
+
+    def __len__(self):
+        return sum(self.data['items'].values())
+
+    def __contains__(self, product_id):
+        return str(product_id) in self.data['items']
+
+    def quantity(self, product_id):
+        return self.data['items'].get(str(product_id), 0)
+
+    def lines(self):
+        """CartLine per item with its product, in one query; products that no longer exist are dropped"""
+        items = self.items
+        products = Product.objects.in_bulk(list(items))
+        missing = items.keys() - products.keys()
+        for product_id in missing:
+            self.remove(product_id)
+        return [CartLine(products[pid], qty) for pid, qty in items.items() if pid in products]
+
+    # --- Changing ---
+    def _changed(self):
+        self.data['dirty'] = True
+        self.session.modified = True
+
+    def add(self, product_id, quantity=1):
+        self.set(product_id, self.quantity(product_id) + quantity)
+
+    def set(self, product_id, quantity):
+        """Raises InsufficientStock, leaving the cart as it was"""
+        if quantity <= 0:
+            return self.remove(product_id)
+        quantity = min(quantity, MAX_QUANTITY)
+        hold(self.holder, product_id, quantity)
+        self.data['items'][str(product_id)] = quantity
+        self._changed()
+
+    def remove(self, product_id):
+        if self.data['items'].pop(str(product_id), None) is not None:
+            release(self.holder, [product_id])
+            self._changed()
+
+    def clear(self):
+        release(self.holder)
+        self.data['items'] = {}
+        self._changed()
+
+    # --- Persistence ---
+    def persist(self):
+        """Write the session cart to Cart/CartItem if it changed since it was loaded"""
+        if self.user is None or not self.data['dirty']:
+            return
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            existing = set(Product.objects.filter(id__in=self.items).values_list('id', flat=True))
+            stale = dict(
+                CartItem.objects.select_for_update().filter(cart__user=self.user)
+                .exclude(cart=cart, product_id__in=existing).values_list('id', 'product_id')
+            )
+            CartItem.objects.filter(id__in=stale).delete()
+            # items saved elsewhere (the API) that the session doesn't have hold stock too; give it back
+            dropped = set(stale.values()) - existing
+            if dropped:
+                release(self.holder, dropped)
+            set_items(cart.id, {pid: qty for pid, qty in self.items.items() if pid in existing})
+        self.data['dirty'] = False
+        self.session.modified = True
+
+    def checked_out(self):
+        """The order took the saved cart items (and their holds); empty the session copy to match"""
+        self.data['items'] = {}
+        self.data['dirty'] = False
+        self.session.modified = True
+
+
+# --- Saved carts ---
+# The API works on Cart/CartItem directly. Every change is a single
+# statement (no read-modify-write), so concurrent requests can't lose updates.
+class InvalidOperation(ValueError):
+    pass
+
+
+OPERATIONS = ('add', 'set', 'remove')
+MAX_OPERATIONS = 100
+
+
+def _tables():
+    qn = connection.ops.quote_name
+    return qn(CartItem._meta.db_table), qn(Cart._meta.db_table)
+
+
+def _stamped(change):
+    """``change`` as a CTE plus the Cart.updated_at stamp when it touched a row: still one statement"""
+    _, carts = _tables()
+    return (
+        f'WITH changed AS ({change} RETURNING 1) '
+        f'UPDATE {carts} SET updated_at = %(now)s WHERE id = %(cart)s AND EXISTS (SELECT 1 FROM changed)'
+    )
+
+
+def _upsert_sql(additive):
+    items, _ = _tables()
+    quantity = 'EXCLUDED.quantity'
+    if additive:
+        total = f'{items}.quantity + EXCLUDED.quantity'
+        quantity = f'CASE WHEN {total} > {MAX_QUANTITY} THEN {MAX_QUANTITY} ELSE {total} END'
+    return _stamped(
+        f'INSERT INTO {items} (cart_id, product_id, quantity) '
+        f'SELECT %(cart)s, product_id, quantity FROM unnest(%(products)s::bigint[], %(quantities)s::integer[]) '
+        f'AS given (product_id, quantity) '
+        f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {quantity}'
+    )
+
+
+def _upsert(cart_id, quantities, additive):
+    if not quantities:
+        return
+    params = {
+        'cart': cart_id, 'now': timezone.now(),
+        'products': list(quantities), 'quantities': [min(qty, MAX_QUANTITY) for qty in quantities.values()],
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(_upsert_sql(additive), params)
+
+
+def add_items(cart_id, quantities):
+    """One INSERT ... ON CONFLICT for all of {product_id: n}: quantity = quantity + n"""
+    _upsert(cart_id, quantities, additive=True)
+
+
+def set_items(cart_id, quantities):
+    """One INSERT ... ON CONFLICT setting absolute quantities for {product_id: n}"""
+    _upsert(cart_id, quantities, additive=False)
+
+
+def remove_items(cart_id, product_ids):
+    if product_ids:
+        items, _ = _tables()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _stamped(f'DELETE FROM {items} WHERE cart_id = %(cart)s AND product_id = ANY(%(products)s)'),
+                {'cart': cart_id, 'products': list(product_ids), 'now': timezone.now()},
+            )
+
+
+def _quantity(value, minimum):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise InvalidOperation(f'quantity must be an integer, got {value!r}')
+    if value < minimum:
+        raise InvalidOperation(f'quantity must be at least {minimum}')
+    return value
+
+
+def coalesce_operations(operations):
+    """
+    Fold an ordered list of {'op': 'add'|'set'|'remove', 'product_id', 'quantity'}
+    into one final change per product: {product_id: ('add', n) | ('set', n)},
+    where ('set', 0) means remove.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidOperation('operations must be a non-empty list')
+    if len(operations) > MAX_OPERATIONS:
+        raise InvalidOperation(f'at most {MAX_OPERATIONS} operations per batch')
+
+    changes = {}
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise InvalidOperation(f"each operation needs 'op' in {', '.join(OPERATIONS)}")
+        try:
+            product_id = int(operation.get('product_id'))
+        except (TypeError, ValueError):
+            raise InvalidOperation('each operation needs an integer product_id')
+
+        kind, current = changes.get(product_id, ('add', 0))
+        if operation['op'] == 'add':
+            changes[product_id] = (kind, current + _quantity(operation.get('quantity', 1), 1))
+        elif operation['op'] == 'set':
+            changes[product_id] = ('set', _quantity(operation.get('quantity'), 0))
+        else:
+            changes[product_id] = ('set', 0)
+    return changes
+
+
+def hold_items(cart_id, holder, product_ids):
+    """Hold the cart's resulting quantity of each of ``product_ids``; raises InsufficientStock"""
+    quantities = dict(
+        CartItem.objects.filter(cart_id=cart_id, product_id__in=product_ids).values_list('product_id', 'quantity')
+    )
+    for product_id in sorted(product_ids):
+        hold(holder, product_id, quantities.get(product_id, 0))
+
+
+def apply_operations(cart_id, operations, holder=None):
+    """
+    Apply a batch of cart operations in one transaction with at most one
+    product check, one additive upsert, one absolute upsert and one DELETE
+    (each also stamps Cart.updated_at when it changed a row), then hold the
+    resulting quantities for ``holder``. Raises InvalidOperation
+    or InsufficientStock (the whole batch is undone).
+    """
+    changes = coalesce_operations(operations)
+    known = set(Product.objects.filter(id__in=changes).values_list('id', flat=True))
+    unknown = sorted(set(changes) - known)
+    if unknown:
+        raise InvalidOperation(f'unknown products: {unknown}')
+
+    adds = {pid: n for pid, (kind, n) in changes.items() if kind == 'add'}
+    sets = {pid: n for pid, (kind, n) in changes.items() if kind == 'set' and n > 0}
+    removals = [pid for pid, (kind, n) in changes.items() if kind == 'set' and n == 0]
+    with transaction.atomic():
+        remove_items(cart_id, removals)
+        set_items(cart_id, sets)
+        add_items(cart_id, adds)
+        if holder is not None:
+            hold_items(cart_id, holder, changes)
+
+
+# --- Login / logout ---
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        SessionCart(request, user).persist()
+
+
+@receiver(user_logged_out)
+def save_cart_on_logout(sender, request, user, **kwargs):
+    # runs before the session is flushed
+    if request is not None and user is not None and hasattr(request, 'session'):
+        SessionCart(request, user).persist()
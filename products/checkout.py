@@ -0,0 +1,101 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Greatest, Now
+
+from .cache import bump_on_commit
+from .models import CartItem, Order, OrderItem, Product
+from .orders import refresh_summaries
+from .reservations import consume, user_holder
+from .tasks import after_order
+
+
+class CartEmpty(Exception):
+    pass
+
+
+class OutOfStock(Exception):
+    def __init__(self, lines):
+        super().__init__('Insufficient stock')
+        self.lines = lines  # [{'product_id', 'name', 'requested', 'available'}]
+
+
+def _shortfalls(quantities, products, held):
+    lines = []
+    for product_id, qty in quantities.items():
+        product = products.get(product_id)
+        # what nobody else holds; unclamped until the end, exactly like the guard in the stock UPDATE
+        available = max(product['stock'] - product['reserved'] + held.get(product_id, 0), 0) if product else 0
+        if available < qty:
+            lines.append({
+                'product_id': product_id,
+                'name': product['name'] if product else None,
+                'requested': qty,
+                'available': available,
+            })
+    return lines
+
+
+def place_order(user):
+    """
+    Turn the user's cart into an order with a fixed number of statements,
+    whatever the cart size: take the shopper's stock holds, lock the products
+    in id order, one conditional stock UPDATE and one bulk INSERT of order
+    items. Units held by other carts are not for sale. Raises CartEmpty or
+    OutOfStock (nothing is written in that case).
+    """
+    with transaction.atomic():
+        cart_items = CartItem.objects.filter(cart__user=user)
+        quantities = defaultdict(int)
+        for product_id, qty in cart_items.values_list('product_id', 'quantity'):
+            quantities[product_id] += qty
+        if not quantities:
+            raise CartEmpty()
+
+        # the shopper's own holds (products.reservations) leave Product.reserved
+        # in the same UPDATE that takes the units out of stock
+        held = consume(user_holder(user), quantities)
+
+        # id order so concurrent checkouts always lock rows in the same order
+        products = {
+            p['id']: p for p in Product.objects.select_for_update()
+            .filter(id__in=quantities).order_by('id').values('id', 'name', 'price', 'stock', 'reserved')
+        }
+        shortfalls = _shortfalls(quantities, products, held)
+        if shortfalls:
+            raise OutOfStock(shortfalls)
+
+        # UPDATE product SET stock = stock - qty, reserved = reserved - held
+        # WHERE id IN (...) AND stock - reserved + held >= qty
+        qty_case = Case(
+            *[When(id=pid, then=Value(q)) for pid, q in quantities.items()],
+            output_field=PositiveIntegerField(),
+        )
+        held_case = Case(
+            *[When(id=pid, then=Value(held.get(pid, 0))) for pid in quantities],
+            output_field=PositiveIntegerField(),
+        )
+        updated = Product.objects.filter(id__in=quantities, stock__gte=qty_case + F('reserved') - held_case).update(
+            stock=F('stock') - qty_case, reserved=Greatest(F('reserved') - held_case, Value(0)), updated_at=Now()
+        )
+        if updated != len(quantities):
+            # the guard above is the authority: never oversell
+            raise OutOfStock(_shortfalls(quantities, products, held))
+        bump_on_commit('product')  # queryset update() sends no post_save
+
+        total = sum(products[pid]['price'] * qty for pid, qty in quantities.items())
+        order = Order.objects.create(user=user, total_amount=total)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=pid, quantity=qty, price=products[pid]['price'])
+            for pid, qty in quantities.items()
+        ])
+
+        refresh_summaries([order.id])
+
+        # sales rollup, low-stock check, confirmation email and invoice run
+        # in the workers once this commits (products.tasks)
+        after_order(order, quantities)
+
+        cart_items.delete()  # clear cart
+    return order
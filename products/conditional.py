@@ -0,0 +1,82 @@
+"""
+Validators for conditional GET (ETag / Last-Modified) on catalogue endpoints.
+
+They are read from the database, so every process agrees on them and a
+write is seen by all of them at once: the newest updated_at and the row
+count of the tables a response is built from (indexed aggregates; the
+count catches deletes), or a single indexed column for one product. A 304
+Not Modified never loads or serialises the rows themselves.
+
+Rows are stamped before their transaction commits, so a write stamped a
+moment before the newest row can still become visible after it. For
+SETTLE after the newest stamp no ETag is given (and nothing is answered
+with a 304); after that the stamps no longer move backwards in practice.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from .models import Menu, Product
+
+SETTLE = timedelta(seconds=10)
+
+
+def table_etag(*models):
+    """ETag from the newest updated_at and the row count of ``models`` plus the full URL"""
+    def etag(request, *args, **kwargs):
+        stamps = [model.objects.aggregate(at=Max('updated_at'), n=Count('id')) for model in models]
+        newest = max((stamp['at'] for stamp in stamps if stamp['at']), default=None)
+        if newest is not None and timezone.now() - newest < SETTLE:
+            return None
+        raw = '|'.join(f"{stamp['at'] and stamp['at'].isoformat()}:{stamp['n']}" for stamp in stamps)
+        return hashlib.md5(f"{raw}|{request.get_full_path()}".encode()).hexdigest()
+    return etag
+
+
+catalogue_etag = table_etag(Product, Menu)
+menu_etag = table_etag(Menu)
+
+
+def product_last_modified(request, pk, *args, **kwargs):
+    # looked up once per request, product_etag reuses it
+    if not hasattr(request, '_product_updated_at'):
+        request._product_updated_at = (
+            Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        )
+    return request._product_updated_at
+
+
+def product_etag(request, pk, *args, **kwargs):
+    # Last-Modified only has one-second resolution, the ETag catches the rest
+    updated_at = product_last_modified(request, pk)
+    return updated_at.isoformat() if updated_at else None
+
+
+def conditional_get(etag_func=None, last_modified_func=None):
+    """condition() for the get method of a class-based view"""
+    return method_decorator(condition(etag_func=etag_func, last_modified_func=last_modified_func), name='get')
+
+
+def aconditional_get(etag_func):
+    """condition(etag_func=...) for an async function view: ``etag_func`` runs off the event loop"""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            etag = await sync_to_async(etag_func)(request, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,155 @@
+import csv
+import datetime
+import re
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Product
+
+EXPORT_FIELDS = (
+    'id', 'sku', 'name', 'price', 'stock', 'description', 'image',
+    'menu_id', 'menu__name', 'updated_at',
+)
+CHUNK_ROWS = 500  # rows per yielded chunk / server-side cursor fetch
+SPACED_OFFSET = re.compile(r'(\d\d:\d\d(?::\d\d(?:\.\d+)?)?) (\d\d(?::?\d\d)?)$')
+
+
+def format_since(moment):
+    """UTC, Z-suffixed: nothing in it needs encoding when passed back as ?since="""
+    return moment.astimezone(datetime.timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def parse_since(raw):
+    """ISO-8601 date or datetime -> aware datetime, None if unparseable"""
+    # a '+hh:mm' offset that wasn't percent-encoded arrives as ' hh:mm'
+    raw = SPACED_OFFSET.sub(r'\1+\2', raw.strip())
+    try:
+        since = parse_datetime(raw)
+        if since is None:
+            day = parse_date(raw)
+            if day is None:
+                return None
+            since = datetime.datetime.combine(day, datetime.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def export_queryset(since=None, asynchronous=False):
+    products = Product.objects.all()
+    if since:
+        products = products.filter(updated_at__gt=since)
+    # values() with menu__name is a single LEFT JOIN, (a)iterator() keeps it on a
+    # server-side cursor so rows are never materialised all at once
+    products = products.order_by('id').values(*EXPORT_FIELDS)
+    if asynchronous:
+        return products.aiterator(chunk_size=CHUNK_ROWS)
+    return products.iterator(chunk_size=CHUNK_ROWS)
+
+
+def _chunked(lines):
+    buf = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= CHUNK_ROWS:
+            yield ''.join(buf)
+            buf = []
+    if buf:
+        yield ''.join(buf)
+
+
+def ndjson_stream(rows, header=True):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    return _chunked(encoder.encode(row) + '\n' for row in rows)
+
+
+class _Echo:
+    """file-like object for csv.writer that hands back each line"""
+    def write(self, value):
+        return value
+
+
+def csv_stream(rows, header=True):
+    writer = csv.writer(_Echo())
+    body = (writer.writerow([row[f] for f in EXPORT_FIELDS]) for row in rows)
+
+    def lines():
+        if header:
+            yield writer.writerow(EXPORT_FIELDS)
+        yield from body
+    return _chunked(lines())
+
+
+async def astream(stream, rows):
+    """
+    ``stream`` over an async row iterator, for ASGI: there Django would
+    collect a sync iterator into a list before sending the first byte.
+    Each CHUNK_ROWS rows are encoded by the sync stream function.
+    """
+    batch, header = [], True
+    async for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK_ROWS:
+            for chunk in stream(batch, header=header):
+                yield chunk
+            batch, header = [], False
+    for chunk in stream(batch, header=header):
+        yield chunk
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows gzip: listed (or x-gzip) with a
+    q above 0, or not listed and covered by a '*' above 0. 'gzip;q=0' refuses it.
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _gzip_compressor():
+    return zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)  # gzip container
+
+
+def gzip_stream(chunks):
+    compressor = _gzip_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def agzip_stream(chunks):
+    compressor = _gzip_compressor()
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'ndjson': (ndjson_stream, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_stream, 'text/csv; charset=utf-8', 'csv'),
+}
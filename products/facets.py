@@ -0,0 +1,261 @@
+"""
+Faceted filtering for the product listing: category (with submenus), price
+range, in stock and minimum rating, each option shown with how many products
+it would leave given the other active filters.
+
+Counts don't come from a GROUP BY per request. One grouped query buckets the
+whole catalogue by (menu, price range, in stock, rating) into a "cube" of at
+most menus x 5 x 2 x 6 cells, cached for FACET_TTL; the counts for any
+filter state are sums over that cube, computed in Python and kept in a
+per-process LRU keyed by the normalised filter state. Counts may lag stock
+and new products by up to FACET_TTL; the product list itself is always live.
+An expired cube is rebuilt by one process at a time (a Postgres advisory
+lock) while the others keep counting from the previous one. Sharing the
+rebuilt cube between processes takes a shared cache (see CACHES); with the
+default local-memory cache each process still builds its own, one after
+another.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import BooleanField, Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Floor
+
+from .cache import versions
+from .models import Menu, MenuClosure, Product
+
+FACET_TTL = 60
+REBUILD_LOCK_ID = 0x66616365747321  # pg advisory lock key for the cube rebuild
+LRU_SIZE = 1024
+
+# key -> (label, low, high); high is exclusive, None means unbounded
+PRICE_RANGES = {
+    'under-250': ('Under ₹250', None, 250),
+    '250-500': ('₹250 – ₹500', 250, 500),
+    '500-1000': ('₹500 – ₹1,000', 500, 1000),
+    '1000-2500': ('₹1,000 – ₹2,500', 1000, 2500),
+    '2500-up': ('₹2,500 and above', 2500, None),
+}
+RATINGS = (4, 3, 2, 1)
+
+
+class FilterState(namedtuple('FilterState', 'category price in_stock rating', defaults=(None, None, False, None))):
+    __slots__ = ()
+
+    @classmethod
+    def from_query(cls, params):
+        """Normalise request parameters; anything unrecognised is dropped rather than an error"""
+        category = params.get('category', '')
+        price = params.get('price')
+        rating = params.get('rating', '')
+        return cls(
+            category=int(category) if category.isdigit() else None,
+            price=price if price in PRICE_RANGES else None,
+            in_stock=params.get('in_stock') == '1',
+            rating=int(rating) if rating.isdigit() and int(rating) in RATINGS else None,
+        )
+
+    def query_string(self, **changes):
+        params = self._replace(**changes)._asdict()
+        params['in_stock'] = '1' if params['in_stock'] else None
+        return urlencode({k: v for k, v in params.items() if v is not None})
+
+    @property
+    def active(self):
+        return self != FilterState()
+
+
+def filter_products(queryset, state):
+    if state.category is not None:
+        queryset = queryset.filter(menu_id__in=Menu.subtree_ids(state.category))
+    if state.price:
+        _, low, high = PRICE_RANGES[state.price]
+        if low is not None:
+            queryset = queryset.filter(price__gte=low)
+        if high is not None:
+            queryset = queryset.filter(price__lt=high)
+    if state.in_stock:
+        queryset = queryset.filter(stock__gt=F('reserved'))  # something left that no cart holds
+    if state.rating:
+        queryset = queryset.filter(rating_avg__gte=state.rating)
+    return queryset
+
+
+# --- Cube ---
+def _price_bucket():
+    whens = []
+    for index, (_, low, high) in enumerate(PRICE_RANGES.values()):
+        condition = Q()
+        if low is not None:
+            condition &= Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        whens.append(When(condition, then=Value(index)))
+    return Case(*whens, output_field=IntegerField())
+
+
+def _build_cube():
+    cells = list(
+        Product.objects.annotate(
+            price_bucket=_price_bucket(),
+            available=Case(When(stock__gt=F('reserved'), then=Value(True)), default=Value(False), output_field=BooleanField()),
+            rating_floor=Cast(Floor('rating_avg'), IntegerField()),
+        )
+        .values_list('menu_id', 'price_bucket', 'available', 'rating_floor')
+        .annotate(n=Count('id')).order_by()
+    )
+    subtrees = {}
+    for ancestor_id, descendant_id in MenuClosure.objects.values_list('ancestor_id', 'descendant_id'):
+        subtrees.setdefault(ancestor_id, set()).add(descendant_id)
+    return {'cells': cells, 'subtrees': subtrees}
+
+
+def _try_rebuild_lock():
+    """Take the rebuild lock until the end of the transaction, without waiting for it"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [REBUILD_LOCK_ID])
+        return cursor.fetchone()[0]
+
+
+def _cube_stamp():
+    """(stamp, cube or None): the stamp names the current cube; the cube is only fetched when needed"""
+    version, = versions('menu')
+    stamp_key = f'facets:stamp:{version}'
+    stamp = cache.get(stamp_key)
+    if stamp is not None:
+        return stamp, None
+    with transaction.atomic():
+        if _try_rebuild_lock():
+            # the process that held it may just have stored a new cube
+            stamp = cache.get(stamp_key)
+            if stamp is not None:
+                return stamp, None
+        else:
+            # another process is rebuilding: serve the last cube meanwhile (build one only on a cold cache)
+            previous = cache.get('facets:current')
+            cube = cache.get(f'facets:cube:{previous}') if previous is not None else None
+            if cube is not None:
+                return previous, cube
+        stamp = f'{version}:{time.time_ns()}'
+        cube = _build_cube()
+        cache.set(f'facets:cube:{stamp}', cube, FACET_TTL * 2)
+        cache.set('facets:current', stamp, FACET_TTL * 2)
+        cache.set(stamp_key, stamp, FACET_TTL)
+    return stamp, cube
+
+
+def _cube(stamp):
+    cube = cache.get(f'facets:cube:{stamp}')
+    if cube is None:  # evicted early: rebuild under the same stamp
+        cube = _build_cube()
+        cache.set(f'facets:cube:{stamp}', cube, FACET_TTL * 2)
+    return cube
+
+
+def _count(cube, state):
+    subtree = cube['subtrees'].get(state.category, {state.category}) if state.category is not None else None
+    price_index = list(PRICE_RANGES).index(state.price) if state.price else None
+    per_menu, prices, ratings = {}, [0] * len(PRICE_RANGES), [0] * 6
+    in_stock = total = 0
+    for menu_id, price_bucket, available, rating_floor, n in cube['cells']:
+        # each facet counts with every filter but its own applied
+        by_category = subtree is None or menu_id in subtree
+        by_price = price_index is None or price_bucket == price_index
+        by_stock = not state.in_stock or available
+        by_rating = state.rating is None or rating_floor >= state.rating
+        if by_price and by_stock and by_rating and menu_id is not None:
+            per_menu[menu_id] = per_menu.get(menu_id, 0) + n
+        if by_category and by_stock and by_rating and price_bucket is not None:
+            prices[price_bucket] += n
+        if by_category and by_price and by_rating and available:
+            in_stock += n
+        if by_category and by_price and by_stock:
+            ratings[min(rating_floor, 5)] += n
+        if by_category and by_price and by_stock and by_rating:
+            total += n
+    categories = {
+        menu_id: sum(per_menu.get(d, 0) for d in descendants)
+        for menu_id, descendants in cube['subtrees'].items()
+    }
+    return {
+        'total': total,
+        'category': categories,
+        'price': dict(zip(PRICE_RANGES, prices)),
+        'in_stock': in_stock,
+        'rating': {r: sum(ratings[r:]) for r in RATINGS},  # "r and up"
+    }
+
+
+class LRU:
+    """A small thread-safe LRU mapping"""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+
+_results = LRU(LRU_SIZE)
+
+
+def facet_counts(state):
+    """Counts for every facet option under ``state``"""
+    stamp, cube = _cube_stamp()
+    key = (stamp, state)
+    counts = _results.get(key)
+    if counts is None:
+        counts = _count(cube or _cube(stamp), state)
+        _results.set(key, counts)
+    return counts
+
+
+# --- Presentation ---
+def facet_options(state, counts, menus):
+    """Option lists for the template: label, count, selected and the query string that toggles it"""
+    def option(label, count, selected, **change):
+        return {'label': label, 'count': count, 'selected': selected, 'query': state.query_string(**change)}
+
+    def category(menu):
+        selected = state.category == menu['id']
+        return option(menu['name'], counts['category'].get(menu['id'], 0), selected,
+                      category=None if selected else menu['id'])
+
+    categories = []
+    for menu in menus:
+        entry = category(menu)
+        entry['children'] = [category(child) for child in menu['children']]
+        # submenus are listed while their menu, or one of them, is the selected category
+        entry['expanded'] = entry['selected'] or any(child['selected'] for child in entry['children'])
+        categories.append(entry)
+
+    return {
+        'category': categories,
+        'price': [
+            option(label, counts['price'][key], state.price == key, price=None if state.price == key else key)
+            for key, (label, _, _) in PRICE_RANGES.items()
+        ],
+        'rating': [
+            option(f'{r}★ & up', counts['rating'][r], state.rating == r, rating=None if state.rating == r else r)
+            for r in RATINGS
+        ],
+        'in_stock': option('In stock only', counts['in_stock'], state.in_stock, in_stock=not state.in_stock),
+        'all_categories': state.query_string(category=None),
+    }
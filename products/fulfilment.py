@@ -0,0 +1,145 @@
+"""
+Bulk order status changes for fulfilment (the batch API and OrderAdmin actions).
+
+transition() moves any number of orders to a new status with one UPDATE.
+Which moves are allowed is part of that statement's WHERE, so an order in
+any other state (including one that changed since it was picked) is
+skipped, not overwritten. For the orders that did move, the same
+transaction then:
+
+- shipped: stamps Shipping.shipped_at (an order without shipping details
+  can't be shipped),
+- cancelled: puts the items back in stock with one aggregated UPDATE and
+  queues one task to take the orders out of the sales rollup,
+- writes one OrderStatusChange per order with bulk_create and refreshes the
+  order summaries.
+
+The UPDATE sends no post_save, which is why all of this is done here.
+"""
+import uuid
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_on_commit
+from .models import Order, OrderItem, OrderStatusChange, Product, Shipping
+from .orders import refresh_summaries
+from .tasks import enqueue, record_orders_sales
+
+MAX_BATCH = 10000
+
+# status -> statuses it may move to
+TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': (),
+    'cancelled': (),
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+class Transition(namedtuple('Transition', 'batch status changed skipped')):
+    """changed: [order id]; skipped: {order id: its current status, None if there's no such order}"""
+    __slots__ = ()
+
+    def as_dict(self):
+        return {
+            'batch': str(self.batch),
+            'status': self.status,
+            'updated': len(self.changed),
+            'order_ids': self.changed,
+            'skipped': [{'id': order_id, 'status': status} for order_id, status in self.skipped.items()],
+        }
+
+
+def sources(status):
+    """statuses an order may move to ``status`` from"""
+    return [source for source, targets in TRANSITIONS.items() if status in targets]
+
+
+def _transition_sql(status):
+    qn = connection.ops.quote_name
+    orders = qn(Order._meta.db_table)
+    condition = ''
+    if status == 'shipped':
+        condition = f'AND EXISTS (SELECT 1 FROM {qn(Shipping._meta.db_table)} s WHERE s.order_id = {orders}.id)'
+    # lock in id order so two runs over overlapping orders can't deadlock;
+    # RETURNING old.status gives each order's status before the move
+    return f"""
+        UPDATE {orders} AS o SET status = %(status)s
+        FROM (
+            SELECT id, status FROM {orders}
+            WHERE id = ANY(%(ids)s) AND status = ANY(%(sources)s) {condition}
+            ORDER BY id FOR UPDATE
+        ) AS old
+        WHERE o.id = old.id
+        RETURNING o.id, old.status
+    """
+
+
+def _restock_sql():
+    qn = connection.ops.quote_name
+    products = qn(Product._meta.db_table)
+    return f"""
+        WITH returned AS (
+            SELECT product_id, sum(quantity) AS quantity FROM {qn(OrderItem._meta.db_table)}
+            WHERE order_id = ANY(%(ids)s) GROUP BY product_id
+        ), locked AS (
+            -- id order, like checkout
+            SELECT id FROM {products} WHERE id IN (SELECT product_id FROM returned) ORDER BY id FOR UPDATE
+        )
+        UPDATE {products} AS p SET stock = p.stock + returned.quantity, updated_at = %(now)s
+        FROM returned WHERE p.id = returned.product_id AND p.id IN (SELECT id FROM locked)
+    """
+
+
+def restock(order_ids):
+    """Put the items of ``order_ids`` back in stock; returns the number of products"""
+    with connection.cursor() as cursor:
+        cursor.execute(_restock_sql(), {'ids': list(order_ids), 'now': timezone.now()})
+        restocked = cursor.rowcount
+    if restocked:
+        bump_on_commit('product')
+    return restocked
+
+
+@transaction.atomic
+def transition(order_ids, status, user=None, note=''):
+    """Move ``order_ids`` to ``status`` where allowed; returns a Transition. Raises InvalidTransition."""
+    if status not in TRANSITIONS:
+        raise InvalidTransition(f'status must be one of {", ".join(TRANSITIONS)}')
+    order_ids = sorted(set(order_ids))
+    if len(order_ids) > MAX_BATCH:
+        raise InvalidTransition(f'at most {MAX_BATCH} orders per batch')
+
+    with connection.cursor() as cursor:
+        cursor.execute(_transition_sql(status), {'status': status, 'ids': order_ids, 'sources': sources(status)})
+        previous = dict(cursor.fetchall())
+    changed = sorted(previous)
+    now = timezone.now()
+    batch = uuid.uuid4()
+
+    if changed:
+        if status == 'shipped':
+            Shipping.objects.filter(order_id__in=changed, shipped_at__isnull=True).update(shipped_at=now)
+        elif status == 'cancelled':
+            restock(changed)
+            enqueue(record_orders_sales, order_ids=changed, sign=-1)
+        OrderStatusChange.objects.bulk_create([
+            OrderStatusChange(
+                order_id=order_id, from_status=previous[order_id], to_status=status,
+                batch=batch, changed_by=user, note=note, created_at=now,
+            )
+            for order_id in changed
+        ])
+        refresh_summaries(changed)
+
+    missing = [order_id for order_id in order_ids if order_id not in previous]
+    skipped = dict.fromkeys(missing)
+    skipped.update(Order.objects.filter(id__in=missing).values_list('id', 'status'))
+    return Transition(batch, status, changed, skipped)
@@ -0,0 +1,123 @@
+"""
+Idempotency-Key support for POSTs that clients retry on flaky networks
+(placing an order, payment, shipping details).
+
+The first request with a key inserts an IdempotencyKey row and runs the view
+in the same transaction, storing the response in the row before commit: the
+work and its recorded response commit or roll back together. A retry finds
+the row and gets the stored response back without the view running again.
+A duplicate that arrives while the first is still running blocks on the
+first one's uncommitted row (Postgres makes a conflicting INSERT wait for
+the other transaction), then replays its response; so concurrent duplicates
+collapse onto one execution. If the first request fails (an exception or a
+5xx) nothing is kept and the next attempt runs normally.
+
+Keys belong to a user and expire after IDEMPOTENCY_KEY_HOURS; run_workers
+deletes expired ones. The same key on a different request is a 422.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+LOCK_NOT_AVAILABLE = '55P03'  # SQLSTATE when lock_timeout runs out
+
+
+def fingerprint(request):
+    """sha256 of method, path and body, so a key can't be replayed for another request"""
+    digest = hashlib.sha256()
+    for part in (request.method, request.get_full_path()):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _claim_sql():
+    qn = connection.ops.quote_name
+    table = qn(IdempotencyKey._meta.db_table)
+    key = qn('key')
+    # an expired row counts as absent and is taken over
+    return (
+        f'INSERT INTO {table} (user_id, {key}, fingerprint, status_code, response, created_at, expires_at) '
+        f'VALUES (%(user)s, %(key)s, %(fingerprint)s, 0, NULL, %(now)s, %(expires)s) '
+        f'ON CONFLICT (user_id, {key}) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, status_code = 0, '
+        f'response = NULL, created_at = EXCLUDED.created_at, expires_at = EXCLUDED.expires_at '
+        f'WHERE {table}.expires_at <= %(now)s '
+        f'RETURNING id'
+    )
+
+
+def _claim(user, key, request_fingerprint):
+    """id of the new row, or None if a finished request already holds the key"""
+    now = timezone.now()
+    params = {
+        'user': user.id, 'key': key, 'fingerprint': request_fingerprint,
+        'now': now, 'expires': now + timedelta(hours=settings.IDEMPOTENCY_KEY_HOURS),
+    }
+    with transaction.atomic(), connection.cursor() as cursor:
+        # a duplicate in flight makes this wait for it; don't wait forever
+        cursor.execute(f'SET LOCAL lock_timeout = {int(settings.IDEMPOTENCY_WAIT_SECONDS * 1000)}')
+        cursor.execute(_claim_sql(), params)
+        row = cursor.fetchone()
+        cursor.execute('SET LOCAL lock_timeout TO DEFAULT')
+    return row[0] if row else None
+
+
+def _replay(record):
+    response = Response(record.response, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler):
+    """Decorator for an APIView handler: honour an Idempotency-Key header when the client sends one"""
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return handler(view, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'}, status=400)
+
+        request_fingerprint = fingerprint(request)
+        with transaction.atomic():
+            try:
+                claimed = _claim(request.user, key, request_fingerprint)
+            except OperationalError as e:
+                if getattr(e.__cause__, 'sqlstate', None) != LOCK_NOT_AVAILABLE:
+                    raise
+                return Response({'error': f'A request with this {HEADER} is still in progress'}, status=409)
+
+            if claimed is None:
+                record = IdempotencyKey.objects.get(user=request.user, key=key)
+                if record.fingerprint != request_fingerprint:
+                    return Response({'error': f'{HEADER} was already used for a different request'}, status=422)
+                return _replay(record)
+
+            response = handler(view, request, *args, **kwargs)
+            if response.status_code >= 500:
+                # undo the handler's writes along with the claim, so the client can retry for real
+                transaction.set_rollback(True)
+            else:
+                # encoded as the JSON renderer does it (Decimal -> number), so a replay reads like the original
+                data = json.loads(json.dumps(response.data, cls=JSONEncoder))
+                IdempotencyKey.objects.filter(id=claimed).update(status_code=response.status_code, response=data)
+        return response
+    return wrapper
+
+
+def prune():
+    """Delete expired keys; returns how many"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
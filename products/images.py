@@ -0,0 +1,183 @@
+"""
+Responsive image derivatives.
+
+Every uploaded image (product, menu, hero, profile picture) gets resized
+WebP and JPEG copies at a few fixed widths, stored under
+MEDIA_ROOT/derived/<content hash>/<width>.<format>. Names come from the
+original's content, so a derivative URL never changes meaning and can be
+cached forever.
+
+Derivatives are made lazily: templates and the API only need the original's
+digest and size (read once, then cached), and the first request for a
+derivative that isn't on disk yet falls through to derivative_view, which
+renders it. manage.py build_image_derivatives pre-renders them in bulk.
+"""
+import hashlib
+import io
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404
+from django.views.decorators.cache import cache_control
+from PIL import Image, ImageOps
+
+WIDTHS = (200, 400, 800, 1200)
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+QUALITY = {'webp': 80, 'jpeg': 82}
+DERIVED_DIR = 'derived'
+DEFAULT_SIZES = '(min-width: 992px) 25vw, (min-width: 768px) 33vw, 50vw'
+
+_FILENAME = re.compile(r'^(?P<width>\d+)\.(?P<fmt>webp|jpeg)$')
+_DIGEST = re.compile(r'^[0-9a-f]{20}$')
+
+
+def _name(image):
+    """Storage name of a FieldFile, or the name itself"""
+    return getattr(image, 'name', image) or ''
+
+
+def _derived_path(digest, *parts):
+    return os.path.join(settings.MEDIA_ROOT, DERIVED_DIR, digest, *parts)
+
+
+def widths_for(original_width):
+    """Derivative widths for an original ``original_width`` wide; never upscaled"""
+    return sorted({min(w, original_width) for w in WIDTHS})
+
+
+class Responsive:
+    __slots__ = ('name', 'digest', 'width', 'height')
+
+    def __init__(self, name, digest, width, height):
+        self.name = name
+        self.digest = digest
+        self.width = width
+        self.height = height
+
+    @property
+    def widths(self):
+        return widths_for(self.width)
+
+    def url(self, width, fmt='jpeg'):
+        return f'{settings.MEDIA_URL}{DERIVED_DIR}/{self.digest}/{width}.{fmt}'
+
+    def srcset(self, fmt):
+        return ', '.join(f'{self.url(w, fmt)} {w}w' for w in self.widths)
+
+    @property
+    def src(self):
+        """fallback for browsers without srcset: the 400px (or largest) JPEG"""
+        widths = self.widths
+        return self.url(min(widths, key=lambda w: abs(w - 400)), 'jpeg')
+
+    def as_dict(self):
+        return {
+            'src': self.src,
+            'width': self.width,
+            'height': self.height,
+            'srcset': {fmt: self.srcset(fmt) for fmt in FORMATS},
+        }
+
+
+def _meta_key(name):
+    return 'img:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def _inspect(name):
+    """(digest, width, height) of the original, or None if it can't be read as an image"""
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = ImageOps.exif_transpose(img).size
+    except (OSError, Image.DecompressionBombError):
+        return None
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    # derivative_view resolves the digest back to its original through this file
+    os.makedirs(_derived_path(digest), exist_ok=True)
+    with open(_derived_path(digest, 'source'), 'w') as fh:
+        fh.write(name)
+    return digest, width, height
+
+
+def responsive_many(images):
+    """{name: Responsive} for the given images/names, one cache round trip for the known ones"""
+    names = {_name(i) for i in images} - {''}
+    keys = {_meta_key(n): n for n in names}
+    found = cache.get_many(list(keys))
+    result = {}
+    for key, name in keys.items():
+        meta = found.get(key)
+        if meta is None:
+            meta = _inspect(name)
+            if meta is None:
+                continue
+            cache.set(key, meta, None)  # storage never rewrites a name in place
+        result[name] = Responsive(name, *meta)
+    return result
+
+
+def responsive(image):
+    return responsive_many([image]).get(_name(image))
+
+
+# --- Rendering derivatives ---
+def render_derivative(digest, width, fmt):
+    """Write derived/<digest>/<width>.<fmt> from its original; returns the path"""
+    target = _derived_path(digest, f'{width}.{fmt}')
+    if os.path.exists(target):
+        return target
+    try:
+        with open(_derived_path(digest, 'source')) as fh:
+            name = fh.read().strip()
+        img = Image.open(os.path.join(settings.MEDIA_ROOT, name))
+    except OSError:
+        raise Http404('Unknown image')
+
+    with img:
+        img = ImageOps.exif_transpose(img)
+        if width not in widths_for(img.width):
+            raise Http404('Unsupported width')
+        img.thumbnail((width, width * 10), Image.LANCZOS)
+        pil_format = FORMATS[fmt][0]
+        if pil_format == 'JPEG' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        tmp = f'{target}.{os.getpid()}.tmp'
+        options = {'optimize': True, 'progressive': True} if pil_format == 'JPEG' else {'method': 4}
+        img.save(tmp, pil_format, quality=QUALITY[fmt], **options)
+    os.replace(tmp, target)  # atomic: concurrent renders of the same file can't serve a partial one
+    return target
+
+
+def render_all(image):
+    """Render every derivative of ``image`` now; returns how many were written"""
+    info = responsive(image)
+    if info is None:
+        return 0
+    written = 0
+    for width in info.widths:
+        for fmt in FORMATS:
+            if not os.path.exists(_derived_path(info.digest, f'{width}.{fmt}')):
+                render_derivative(info.digest, width, fmt)
+                written += 1
+    return written
+
+
+@cache_control(public=True, max_age=60 * 60 * 24 * 365, immutable=True)
+def derivative_view(request, digest, filename):
+    """
+    Renders a derivative on its first request. Afterwards the file exists and
+    is served straight from MEDIA_ROOT by whatever serves media (nginx,
+    SERVE_MEDIA, or static() in development); until then they fall back here.
+    """
+    match = _FILENAME.match(filename)
+    if not match or not _DIGEST.match(digest):
+        raise Http404('Unknown image')
+    fmt = match['fmt']
+    path = render_derivative(digest, int(match['width']), fmt)
+    return FileResponse(open(path, 'rb'), content_type=FORMATS[fmt][1])
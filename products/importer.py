@@ -0,0 +1,198 @@
+import codecs
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import DatabaseError, transaction
+
+from .cache import bump
+from .models import Menu, Product
+from .search import update_search_vectors
+
+DEFAULT_CHUNK_SIZE = 1000
+# input column -> field it updates on existing rows; columns a file leaves out keep their current values
+OPTIONAL_COLUMNS = {'stock': 'stock', 'description': 'description', 'menu': 'menu', 'menu_id': 'menu'}
+ALWAYS_UPDATED = ('name', 'price', 'updated_at')  # name and price are required in every row
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    written: int = 0
+    errors: list = field(default_factory=list)  # [(line, message)]
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self, max_errors=100):
+        return {
+            'rows': self.rows,
+            'written': self.written,
+            'failed': len(self.errors),
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'errors': [{'line': line, 'error': msg} for line, msg in self.errors[:max_errors]],
+        }
+
+
+def is_utf8(upload):
+    """Decode the whole upload once up front, so a bad byte can't stop an import half-written"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        for chunk in upload.chunks():
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    finally:
+        upload.seek(0)
+    return True
+
+
+def update_fields(row):
+    """Fields an upsert of ``row`` overwrites on an existing product"""
+    fields = set(ALWAYS_UPDATED)
+    fields.update(field for column, field in OPTIONAL_COLUMNS.items() if column in row)
+    return tuple(sorted(fields))
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, dict) from a text stream of CSV or NDJSON."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'ndjson':
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f'Unknown format {fmt!r}')
+
+
+class ProductImporter:
+    """
+    Upserts products keyed on ``sku`` in chunks of ``chunk_size`` rows using
+    one INSERT ... ON CONFLICT per chunk. Bad rows are collected in the
+    result instead of aborting the load.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._menus = None
+
+    @property
+    def menus(self):
+        # single lookup for the whole run: {'name': {lower(name): id}, 'id': {str(id): id}}
+        if self._menus is None:
+            self._menus = {'name': {}, 'id': {}}
+            for menu_id, name in Menu.objects.values_list('id', 'name').order_by('-id'):
+                self._menus['name'][name.strip().lower()] = menu_id
+                self._menus['id'][str(menu_id)] = menu_id
+        return self._menus
+
+    def build(self, row):
+        if row is None:
+            raise RowError('Row is not a JSON object')
+
+        sku = str(row.get('sku') or '').strip()
+        name = str(row.get('name') or '').strip()
+        if not sku:
+            raise RowError('sku required')
+        if len(sku) > 64:
+            raise RowError('sku longer than 64 characters')
+        if not name:
+            raise RowError('name required')
+        if len(name) > 200:
+            raise RowError('name longer than 200 characters')
+
+        try:
+            price = Decimal(str(row.get('price')).strip()).quantize(Decimal('0.01'))
+        except (InvalidOperation, ValueError):
+            raise RowError(f'Invalid price {row.get("price")!r}')
+        if not price.is_finite() or price < 0 or price >= Decimal('1e8'):
+            raise RowError(f'Price out of range {price}')
+
+        raw_stock = row.get('stock')
+        try:
+            stock = int(raw_stock) if raw_stock not in (None, '') else 0
+        except (TypeError, ValueError):
+            raise RowError(f'Invalid stock {raw_stock!r}')
+        if stock < 0:
+            raise RowError('stock must not be negative')
+
+        menu_id = None
+        for column, key in (('menu_id', 'id'), ('menu', 'name')):
+            value = row.get(column)
+            if value not in (None, ''):
+                menu_id = self.menus[key].get(str(value).strip().lower())
+                if menu_id is None:
+                    raise RowError(f'Unknown {column} {value!r}')
+                break
+
+        return Product(
+            sku=sku, name=name, price=price, stock=stock,
+            description=str(row.get('description') or ''),
+            menu_id=menu_id,
+        )
+
+    def write(self, batch, result):
+        # ON CONFLICT cannot touch the same row twice in one statement: the last row wins,
+        # as it would across chunks, and the rows it overrides are reported, not written
+        by_sku = {}
+        for line, product, fields in batch:
+            if product.sku in by_sku:
+                result.errors.append((by_sku[product.sku][0], f'sku {product.sku!r} repeated on line {line}'))
+            by_sku[product.sku] = (line, product, fields)
+        # one upsert per set of columns present: a single one for CSV, whose rows share a header
+        groups = {}
+        for _, product, fields in by_sku.values():
+            groups.setdefault(fields, []).append(product)
+        try:
+            with transaction.atomic():
+                for fields, products in groups.items():
+                    Product.objects.bulk_create(
+                        products,
+                        update_conflicts=True,
+                        unique_fields=['sku'],
+                        update_fields=list(fields),
+                    )
+                update_search_vectors(Product.objects.filter(sku__in=by_sku))
+        except DatabaseError as e:
+            result.errors.extend((line, f'Batch failed: {e}') for line, _, _ in by_sku.values())
+            return
+        result.written += len(by_sku)
+
+    def run(self, rows):
+        result = ImportResult()
+        started = time.monotonic()
+        batch = []
+        for line, row in rows:
+            result.rows += 1
+            try:
+                batch.append((line, self.build(row), update_fields(row)))
+            except RowError as e:
+                result.errors.append((line, str(e)))
+                continue
+            if len(batch) >= self.chunk_size:
+                self.write(batch, result)
+                batch = []
+        if batch:
+            self.write(batch, result)
+        if result.written:
+            bump('product')  # bulk_create sends no post_save
+        result.elapsed = time.monotonic() - started
+        return result
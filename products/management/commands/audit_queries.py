@@ -0,0 +1,137 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from products.models import Menu, Order, Product
+
+
+def seq_scans(plan, min_rows):
+    """Seq Scan nodes of an EXPLAIN (FORMAT JSON) plan estimated above ``min_rows``"""
+    found = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get('Node Type') == 'Seq Scan' and node.get('Plan Rows', 0) >= min_rows:
+            found.append({'table': node.get('Relation Name'), 'rows': node.get('Plan Rows'),
+                          'filter': node.get('Filter')})
+        nodes.extend(node.get('Plans', []))
+    return found
+
+
+class Command(BaseCommand):
+    help = "Run the hot views against the current (seeded) database and report EXPLAIN plans with sequential scans"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Username to browse as (default: the user with the most orders)")
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help="Ignore seq scans the planner expects to return fewer rows (small tables)")
+        parser.add_argument('--keep-cache', action='store_true', help="Don't clear the cache before each view")
+        parser.add_argument('--json', action='store_true')
+        parser.add_argument('--fail-on-seqscan', action='store_true', help="Exit 1 if any seq scan is reported")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("audit_queries needs PostgreSQL (EXPLAIN FORMAT JSON)")
+
+        user = self.pick_user(options['user'])
+        product = Product.objects.order_by('-id').first()
+        menu = Menu.objects.filter(parent__isnull=True).first()
+        order = Order.objects.filter(user=user).order_by('-id').first()
+        if product is None:
+            raise CommandError("No products; seed the database first (manage.py seed_benchmark)")
+
+        web = Client(HTTP_HOST='localhost', raise_request_exception=False)
+        web.force_login(user)
+        token, _ = Token.objects.get_or_create(user=user)
+        api = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}', raise_request_exception=False)
+
+        routes = [
+            (web, '/'),
+            (web, '/products/products/'),
+            (web, f'/products/products/?category={menu.id}' if menu else None),
+            (web, f'/products/products/{product.id}/'),
+            (web, '/products/cart/'),
+            (web, '/products/favourites/'),
+            (web, '/products/orders/'),
+            (web, f'/products/orders/{order.id}/' if order else None),
+            (web, '/api/menus/'),
+            (api, '/api/products/?limit=50'),
+            (api, '/api/products/?sort=price&limit=50'),
+            (api, f'/api/products/?menu={menu.id}' if menu else None),
+            (api, f'/api/products/{product.id}/'),
+            (api, f'/api/products/{product.id}/reviews/'),
+            (api, '/api/products/best-sellers/?days=30'),
+            (api, '/api/cart/'),
+            (api, '/api/orders/'),
+        ]
+
+        report = []
+        for client, path in routes:
+            if path is None:
+                continue
+            report.append(self.audit(client, path, options))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.print_report(report)
+
+        if options['fail_on_seqscan'] and any(r['seq_scans'] for r in report):
+            raise CommandError("Sequential scans found")
+
+    def pick_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"No user {username!r}")
+        # the account with the most orders: N+1s show on heavy histories, not on the newest one
+        user = (User.objects.annotate(orders=Count('order')).filter(orders__gt=0).order_by('-orders', 'id').first()
+                or User.objects.order_by('id').first())
+        if user is None:
+            raise CommandError("No users; seed the database first (manage.py seed_benchmark)")
+        return user
+
+    def audit(self, client, path, options):
+        if not options['keep_cache']:
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            status = client.get(path).status_code
+
+        scans = []
+        seen = set()
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT') or sql in seen:
+                continue
+            seen.add(sql)
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            for scan in seq_scans(plan[0]['Plan'], options['min_rows']):
+                scans.append({**scan, 'sql': sql})
+
+        return {
+            'path': path,
+            'status': status,
+            'queries': len(ctx.captured_queries),
+            'db_ms': round(sum(float(q['time']) for q in ctx.captured_queries) * 1000, 2),
+            'seq_scans': scans,
+        }
+
+    def print_report(self, report):
+        for row in report:
+            line = f"{row['path']:<45} {row['status']!s:<5} {row['queries']:>4} queries {row['db_ms']:>9} ms"
+            self.stdout.write(self.style.WARNING(line) if row['seq_scans'] else line)
+            for scan in row['seq_scans']:
+                self.stdout.write(f"    Seq Scan on {scan['table']} (~{scan['rows']} rows) filter={scan['filter']}")
+                self.stdout.write(f"      {scan['sql'][:300]}")
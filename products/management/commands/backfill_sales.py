@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from products.sales import backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProductSalesDaily rollup from order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Only rebuild the trailing N days (default: all history)")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['days'] is not None:
+            if options['days'] < 1:
+                raise CommandError("--days must be positive")
+            since = timezone.localdate() - datetime.timedelta(days=options['days'] - 1)
+        rows = backfill(since)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {rows} daily sales rows"))
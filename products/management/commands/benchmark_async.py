@@ -0,0 +1,135 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client
+from django.utils import timezone
+
+from products.bench import git_commit, percentiles
+from products.models import Menu, Product
+
+
+class Command(BaseCommand):
+    help = ("Compare the async catalogue/dashboard views served through the ASGI handler with the same "
+            "views through the WSGI handler, at equal concurrency")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help="Requests per path and handler")
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help="Threads (WSGI) or in-flight coroutines on one event loop (ASGI)")
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        menu_ids = list(Menu.objects.values_list('id', flat=True)[:100])
+        product_ids = list(Product.objects.order_by('-id').values_list('id', flat=True)[:5000])
+        if not menu_ids or not product_ids:
+            raise CommandError("No benchmark data; run manage.py seed_benchmark first")
+
+        rng = random.Random(options['seed'])
+        paths = {
+            'dashboard': lambda: '/',
+            'listing': lambda: f'/products/products/?category={rng.choice(menu_ids)}',
+            'detail': lambda: f'/products/products/{rng.choice(product_ids)}/',
+            'menus': lambda: '/api/menus/',
+        }
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+            },
+            'paths': {},
+        }
+        for name, make_path in paths.items():
+            urls = [make_path() for _ in range(options['warmup'] + options['requests'])]
+            wsgi = self.run_wsgi(urls, options)
+            asgi = self.run_asgi(urls, options)
+            report['paths'][name] = {
+                'wsgi': wsgi,
+                'asgi': asgi,
+                'p95_change': round(asgi['latency_ms']['p95'] / wsgi['latency_ms']['p95'] - 1, 4),
+                'throughput_change': round(asgi['throughput_rps'] / wsgi['throughput_rps'] - 1, 4),
+            }
+            self.stderr.write(
+                f"{name:<10} wsgi p50 {wsgi['latency_ms']['p50']:>8} p95 {wsgi['latency_ms']['p95']:>8} "
+                f"{wsgi['throughput_rps']:>8} rps | asgi p50 {asgi['latency_ms']['p50']:>8} "
+                f"p95 {asgi['latency_ms']['p95']:>8} {asgi['throughput_rps']:>8} rps"
+            )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def summary(self, latencies, errors, wall):
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput_rps': round(len(latencies) / wall, 2),
+            'latency_ms': percentiles(latencies),
+        }
+
+    def run_wsgi(self, urls, options):
+        warmup, timed = urls[:options['warmup']], urls[options['warmup']:]
+        latencies, errors, lock = [], [0], threading.Lock()
+        client_for = threading.local()
+
+        def fetch(url, record=True):
+            if not hasattr(client_for, 'client'):
+                client_for.client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+            started = time.perf_counter()
+            status = client_for.client.get(url).status_code
+            elapsed = time.perf_counter() - started
+            if record:
+                with lock:
+                    latencies.append(elapsed)
+                    errors[0] += status >= 400
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(lambda url: fetch(url, record=False), warmup))
+            started = time.perf_counter()
+            list(pool.map(fetch, timed))
+            wall = time.perf_counter() - started
+            # one close per worker thread; the barrier makes each thread take exactly one
+            barrier = threading.Barrier(options['concurrency'])
+            list(pool.map(lambda _: (barrier.wait(), connections.close_all()), range(options['concurrency'])))
+        return self.summary(latencies, errors[0], wall)
+
+    def run_asgi(self, urls, options):
+        warmup, timed = urls[:options['warmup']], urls[options['warmup']:]
+        latencies, errors = [], [0]
+
+        async def worker(queue, record):
+            client = AsyncClient(HTTP_HOST='localhost', raise_request_exception=False)
+            while queue:
+                url = queue.pop()
+                started = time.perf_counter()
+                response = await client.get(url)
+                if record:
+                    latencies.append(time.perf_counter() - started)
+                    errors[0] += response.status_code >= 400
+
+        async def run(batch, record):
+            queue = list(reversed(batch))
+            await asyncio.gather(*(worker(queue, record) for _ in range(options['concurrency'])))
+
+        async def main():
+            await run(warmup, record=False)
+            started = time.perf_counter()
+            await run(timed, record=True)
+            return time.perf_counter() - started
+
+        wall = asyncio.run(main())
+        return self.summary(latencies, errors[0], wall)
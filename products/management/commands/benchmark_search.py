@@ -0,0 +1,126 @@
+"""
+Compare search latency at catalogue sizes, on a throwaway database: it
+bulk-inserts synthetic products (sku bench-*) and deletes them afterwards.
+
+    manage.py benchmark_search --sizes 100000,1000000 --yes
+
+Measured on a local PostgreSQL 16 without pg_trgm (so full-text ranking
+only), 40 queries per path, milliseconds:
+
+    products   full-text p50 / p95   ILIKE p50 / p95
+    100k        69 / 130              242 / 375
+    1M         976 / 1123            1667 / 3700
+"""
+import itertools
+import json
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+
+from products.bench import WORDS, misspell, percentiles, synthetic_products, timed
+from products.cache import bump
+from products.models import Menu, Product
+from products.search import search_products, update_search_vectors
+
+
+def ilike_search(q, limit=20):
+    """the admin's search_fields path: unindexed ILIKE on name/description"""
+    matched = Product.objects.filter(Q(name__icontains=q) | Q(description__icontains=q))
+    list(matched.values('menu_id').annotate(count=Count('id')))
+    return list(matched.order_by('id')[:limit])
+
+
+class Command(BaseCommand):
+    help = "Compare full-text/trigram search latency with the ILIKE path at given catalogue sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100000,1000000', help="Comma separated product counts")
+        parser.add_argument('--queries', type=int, default=40, help="Queries per size and path")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--yes', action='store_true',
+                            help="Really add the synthetic products to this database (removed again afterwards)")
+        parser.add_argument('--keep', action='store_true', help="Leave the synthetic products in place")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Search benchmark needs PostgreSQL")
+        try:
+            sizes = sorted(int(s) for s in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError("--sizes must be comma separated integers")
+        if not options['yes']:
+            raise CommandError(
+                f"This bulk-inserts up to {max(sizes)} synthetic products (sku bench-*) into database "
+                f"{connection.settings_dict['NAME']!r}, which has {Product.objects.count()} products now. "
+                f"Point it at a dedicated database and pass --yes."
+            )
+
+        rng = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['queries']):
+            words = rng.sample(WORDS, rng.randint(1, 2))
+            if rng.random() < 0.3:
+                words[0] = misspell(words[0], rng)  # typo tolerance
+            queries.append(' '.join(words))
+
+        menu_ids = list(Menu.objects.values_list('id', flat=True))
+        first_new_id = (Product.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        report = {}
+        try:
+            for size in sizes:
+                self.grow_catalogue(size, menu_ids, options['batch_size'], options['seed'])
+                fts = [timed(search_products, q, None, 20) for q in queries]
+                ilike = [timed(ilike_search, q) for q in queries]
+                report[size] = {'fulltext_trigram': percentiles(fts), 'ilike': percentiles(ilike)}
+                self.stderr.write(f"{size} products: fts p50 {report[size]['fulltext_trigram']['p50']}ms, "
+                                  f"ilike p50 {report[size]['ilike']['p50']}ms")
+        finally:
+            if not options['keep']:
+                self.remove_generated(first_new_id, options['batch_size'])
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def remove_generated(self, first_id, batch_size):
+        """Delete the products this run added (nothing references them yet), a batch of ids at a time"""
+        table = connection.ops.quote_name(Product._meta.db_table)
+        deleted = 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} "
+                    f"WHERE id >= %s AND sku LIKE 'bench-%%' ORDER BY id LIMIT %s)",
+                    [first_id, batch_size],
+                )
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+        if deleted:
+            bump('product')  # no signals from the raw DELETE
+            self.stderr.write(f"Removed {deleted} synthetic products")
+
+    def grow_catalogue(self, size, menu_ids, batch_size, seed):
+        existing = Product.objects.count()
+        if existing < size:
+            self.stderr.write(f"Generating {size - existing} products...")
+            start = Product.objects.filter(sku__startswith='bench-').count()
+            rows = synthetic_products(start, size - existing, menu_ids, seed)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                Product.objects.bulk_create(batch, batch_size=batch_size)
+
+        last_id = 0
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id, search_vector__isnull=True)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            update_search_vectors(Product.objects.filter(id__in=ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE {connection.ops.quote_name(Product._meta.db_table)}')
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Profile
+from products.images import render_all
+from products.models import HerosectionImages, Menu, Product
+
+SOURCES = (
+    (Product, 'image'),
+    (Menu, 'image'),
+    (HerosectionImages, 'image'),
+    (Profile, 'profile_pic'),
+)
+
+
+class Command(BaseCommand):
+    help = "Pre-render the WebP/JPEG width derivatives of every uploaded image (otherwise made on first request)"
+
+    def handle(self, *args, **options):
+        written = 0
+        for model, field in SOURCES:
+            names = (
+                model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                .values_list(field, flat=True).distinct().iterator()
+            )
+            for name in names:
+                written += render_all(name)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} derivatives"))
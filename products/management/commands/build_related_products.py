@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products.related import TOP_K, build
+
+
+class Command(BaseCommand):
+    help = ("Precompute related products from order/cart/favourite co-occurrence; "
+            "by default only for products with activity since the last run")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every product (e.g. nightly)")
+        parser.add_argument('--top', type=int, default=TOP_K, help="Related products kept per product")
+
+    def handle(self, *args, **options):
+        if options['top'] < 1:
+            raise CommandError("--top must be positive")
+        considered, written = build(full=options['full'], top_k=options['top'])
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {considered} products, wrote {written} related rows"))
@@ -0,0 +1,93 @@
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from products.bench import git_commit, percentiles
+
+DEFAULT_PATHS = '/,/products/products/,/api/menus/,/api/products/?limit=50'
+
+
+class Command(BaseCommand):
+    help = ("Closed-loop HTTP load against a running server (runserver, gunicorn, nginx...): "
+            "requests per second and latency percentiles over keep-alive connections")
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="Base URL, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--paths', default=DEFAULT_PATHS, help="Comma separated, requested round-robin")
+        parser.add_argument('--connections', type=int, default=16, help="Concurrent client connections")
+        parser.add_argument('--duration', type=float, default=20, help="Seconds to measure")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds of unmeasured load first")
+        parser.add_argument('--label', help="Name for this run in the report (e.g. runserver, gunicorn)")
+        parser.add_argument('--output', help="Append the JSON result to this file (one run per line)")
+
+    def handle(self, *args, **options):
+        base = urlsplit(options['url'])
+        if base.scheme not in ('http', 'https') or not base.netloc:
+            raise CommandError("url must look like http://host:port")
+        paths = [p.strip() for p in options['paths'].split(',') if p.strip()]
+
+        latencies, statuses, lock = [], {}, threading.Lock()
+        measuring = threading.Event()
+        stop = threading.Event()
+
+        def client(n):
+            conn_class = http.client.HTTPSConnection if base.scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(base.netloc, timeout=30)
+            i = n
+            while not stop.is_set():
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers={'Accept-Encoding': 'gzip'})
+                    response = conn.getresponse()
+                    response.read()
+                    status = response.status
+                    if response.getheader('Connection', '').lower() == 'close':
+                        conn.close()
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    status = 'error'
+                elapsed = time.perf_counter() - started
+                if measuring.is_set():
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[status] = statuses.get(status, 0) + 1
+            conn.close()
+
+        threads = [threading.Thread(target=client, args=(n,), daemon=True) for n in range(options['connections'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['warmup'])
+        measuring.set()
+        started = time.perf_counter()
+        time.sleep(options['duration'])
+        measuring.clear()
+        wall = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        result = {
+            'label': options['label'] or options['url'],
+            'commit': git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'connections': options['connections'],
+            'paths': paths,
+            'requests': len(latencies),
+            'rps': round(len(latencies) / wall, 2),
+            'statuses': {str(k): v for k, v in sorted(statuses.items(), key=str)},
+            'latency_ms': percentiles(latencies),
+        }
+        self.stderr.write(f"{result['label']}: {result['rps']} rps, p50 {result['latency_ms'].get('p50')} "
+                          f"p99 {result['latency_ms'].get('p99')} ms, statuses {result['statuses']}")
+        if options['output']:
+            with open(options['output'], 'a') as fh:
+                fh.write(json.dumps(result) + '\n')
+        else:
+            self.stdout.write(json.dumps(result, indent=2))
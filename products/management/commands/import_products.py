@@ -0,0 +1,65 @@
+import io
+import json
+import shutil
+import sys
+import tempfile
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import DEFAULT_CHUNK_SIZE, ProductImporter, is_utf8, read_rows
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert products (keyed on sku) from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV/NDJSON file, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Input format (default: from the file extension)")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--max-errors', type=int, default=50, help="Errors to print")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format']
+        if fmt is None:
+            if path.endswith('.csv'):
+                fmt = 'csv'
+            elif path.endswith(('.ndjson', '.jsonl')):
+                fmt = 'ndjson'
+            else:
+                raise CommandError("Can't tell the format from the file name, pass --format")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        importer = ProductImporter(chunk_size=options['chunk_size'])
+        try:
+            if path == '-':
+                # stdin can't be rewound, so spool it to check the encoding before writing anything
+                raw = tempfile.TemporaryFile()
+                shutil.copyfileobj(sys.stdin.buffer, raw)
+                raw.seek(0)
+            else:
+                raw = open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+        with raw:
+            if not is_utf8(File(raw)):
+                raise CommandError("File must be UTF-8; nothing was written")
+            stream = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            result = importer.run(read_rows(stream, fmt))
+
+        if options['json']:
+            self.stdout.write(json.dumps(result.as_dict(max_errors=options['max_errors'])))
+            return
+
+        for line, msg in result.errors[:options['max_errors']]:
+            self.stderr.write(f"line {line}: {msg}")
+        if len(result.errors) > options['max_errors']:
+            self.stderr.write(f"... {len(result.errors) - options['max_errors']} more errors")
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.rows} rows, {result.written} written, {len(result.errors)} failed "
+            f"in {result.elapsed:.2f}s ({result.rows_per_second:.0f} rows/s)"
+        ))
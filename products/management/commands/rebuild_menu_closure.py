@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import bump
+from products.menus import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the menu closure table from Menu.parent (after bulk menu imports or raw updates)"
+
+    def handle(self, *args, **options):
+        pairs = rebuild()
+        bump('menu')
+        self.stdout.write(self.style.SUCCESS(f"Wrote {pairs} ancestor/descendant pairs"))
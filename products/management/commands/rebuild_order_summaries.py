@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.orders import backfill_summaries
+
+
+class Command(BaseCommand):
+    help = "Rewrite the OrderSummary row of every order (after bulk imports, or to backfill)"
+
+    def handle(self, *args, **options):
+        written = backfill_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} order summaries"))
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from products.cache import bump
+from products.models import Product, Review
+
+
+def _rebuild_sql():
+    qn = connection.ops.quote_name
+    products = qn(Product._meta.db_table)
+    reviews = qn(Review._meta.db_table)
+    # the LEFT JOIN zeroes products without reviews; the buckets clamp like Product.apply_rating_delta;
+    # rows that are already right aren't written, so their updated_at (and ETag) stays
+    return f"""
+        UPDATE {products} AS p SET
+            rating_count = s.n, rating_sum = s.total,
+            rating_avg = CASE WHEN s.n > 0 THEN s.total::float / s.n ELSE 0 END,
+            rating_1 = s.r1, rating_2 = s.r2, rating_3 = s.r3, rating_4 = s.r4, rating_5 = s.r5,
+            updated_at = %(now)s
+        FROM (
+            SELECT q.id, COALESCE(r.n, 0) AS n, COALESCE(r.total, 0) AS total,
+                   COALESCE(r.r1, 0) AS r1, COALESCE(r.r2, 0) AS r2, COALESCE(r.r3, 0) AS r3,
+                   COALESCE(r.r4, 0) AS r4, COALESCE(r.r5, 0) AS r5
+            FROM {products} AS q LEFT JOIN (
+                SELECT product_id, count(*) AS n, sum(rating) AS total,
+                       count(*) FILTER (WHERE rating <= 1) AS r1,
+                       count(*) FILTER (WHERE rating = 2) AS r2,
+                       count(*) FILTER (WHERE rating = 3) AS r3,
+                       count(*) FILTER (WHERE rating = 4) AS r4,
+                       count(*) FILTER (WHERE rating >= 5) AS r5
+                FROM {reviews} WHERE product_id BETWEEN %(low)s AND %(high)s
+                GROUP BY product_id
+            ) AS r ON r.product_id = q.id
+            WHERE q.id BETWEEN %(low)s AND %(high)s
+        ) AS s
+        WHERE p.id = s.id
+          AND (p.rating_count, p.rating_sum, p.rating_1, p.rating_2, p.rating_3, p.rating_4, p.rating_5)
+              IS DISTINCT FROM (s.n, s.total, s.r1, s.r2, s.r3, s.r4, s.r5)
+    """
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalised rating fields on Product from the reviews table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20000, help="Product ids per UPDATE")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        bounds = Product.objects.aggregate(low=Min('id'), high=Max('id'))
+        updated = 0
+        if bounds['low'] is not None:
+            sql, now = _rebuild_sql(), timezone.now()
+            # one set-based UPDATE per id range, each its own short transaction
+            for low in range(bounds['low'], bounds['high'] + 1, batch_size):
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(sql, {'low': low, 'high': low + batch_size - 1, 'now': now})
+                    updated += cursor.rowcount
+
+        # cached pages, best sellers and product ETags all show ratings
+        bump('product')
+        bump('review')
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings, {updated} products changed"))
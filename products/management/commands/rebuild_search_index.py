@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Recompute Product.search_vector in id batches (use after loading data without signals)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--missing-only', action='store_true', help="Only rows without a vector")
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['missing_only']:
+            products = products.filter(search_vector__isnull=True)
+
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(
+                products.filter(id__gt=last_id).order_by('id')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            updated += update_search_vectors(Product.objects.filter(id__in=ids))
+
+        self.stdout.write(self.style.SUCCESS(f"Updated search vectors for {updated} products"))
@@ -0,0 +1,254 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from products.bench import git_commit, percentiles
+from products.models import Menu, Product
+
+
+# --- Scenarios ---
+# Each takes a Session and returns the responses it produced; every
+# response is one timed sample.
+def dashboard(session):
+    return [session.web.get('/')]
+
+
+def listing(session):
+    category = session.rng.choice(session.menu_ids)
+    return [session.web.get(f'/products/products/?category={category}')]
+
+
+def faceted_listing(session):
+    category = session.rng.choice(session.menu_ids)
+    rating = session.rng.choice((2, 3, 4))
+    return [session.web.get(f'/products/products/?category={category}&in_stock=1&rating={rating}')]
+
+
+def detail(session):
+    return [session.web.get(f'/products/products/{session.product_id()}/')]
+
+
+def cart(session):
+    return [session.web.get('/products/cart/')]
+
+
+def api_listing(session):
+    return [session.api.get('/api/products/?limit=50&sort=' + session.rng.choice(('id', 'price', '-rating')))]
+
+
+def api_detail(session):
+    return [session.api.get(f'/api/products/{session.product_id()}/')]
+
+
+def add_to_cart(session):
+    return [session.api.post('/api/cart/', {'product_id': session.product_id(), 'quantity': 1},
+                             content_type='application/json')]
+
+
+def checkout(session):
+    added = add_to_cart(session)
+    return added + [session.api.post('/api/orders/', {}, content_type='application/json')]
+
+
+def order_history(session):
+    return [session.web.get('/products/orders/'), session.api.get('/api/orders/')]
+
+
+SCENARIOS = {
+    'dashboard': dashboard,
+    'listing': listing,
+    'faceted_listing': faceted_listing,
+    'detail': detail,
+    'cart': cart,
+    'api_listing': api_listing,
+    'api_detail': api_detail,
+    'add_to_cart': add_to_cart,
+    'checkout': checkout,
+    'order_history': order_history,
+}
+
+
+class Session:
+    """One simulated user: a logged-in web client and a token-authenticated API client"""
+
+    def __init__(self, user, token, menu_ids, product_ids, seed):
+        self.rng = random.Random(seed)
+        self.menu_ids = menu_ids
+        self.product_ids = product_ids
+        self.web = Client(HTTP_HOST='localhost', raise_request_exception=False)
+        self.web.force_login(user)
+        self.api = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token}', raise_request_exception=False)
+
+    def product_id(self):
+        return self.rng.choice(self.product_ids)
+
+
+class Sampler:
+    """Times every request a scenario makes and counts the queries it ran"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def run(self, scenario, session):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            responses = scenario(session)
+        elapsed = time.perf_counter() - started
+
+        errors = sum(r.status_code >= 400 for r in responses)
+        with self.lock:
+            self.latencies.append(elapsed / len(responses))
+            self.queries.append(queries / len(responses))
+            self.errors += errors
+
+    def summary(self, wall_seconds):
+        n = len(self.latencies)
+        return {
+            'requests': n,
+            'errors': self.errors,
+            'throughput_rps': round(n / wall_seconds, 2) if wall_seconds else None,
+            'latency_ms': percentiles(self.latencies),
+            'queries_per_request': round(sum(self.queries) / n, 2) if n else None,
+            'max_queries': max(self.queries, default=None),
+        }
+
+
+class Command(BaseCommand):
+    help = ("Drive the dashboard, listing, detail, cart and checkout paths through the test client with "
+            "concurrent workers and report latency percentiles, queries per request and throughput as JSON")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help=f"Comma separated, from: {', '.join(SCENARIOS)}")
+        parser.add_argument('--requests', type=int, default=200, help="Iterations per scenario")
+        parser.add_argument('--workers', type=int, default=4, help="Concurrent threads")
+        parser.add_argument('--warmup', type=int, default=10, help="Untimed iterations per scenario")
+        parser.add_argument('--users', type=int, default=50, help="Distinct bench users to spread load over")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--compare', help="Baseline JSON report to diff against")
+
+    def handle(self, *args, **options):
+        names = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+        unknown = set(names) - SCENARIOS.keys()
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        users = list(User.objects.filter(username__startswith='bench-user-').order_by('id')[:options['users']])
+        menu_ids = list(Menu.objects.values_list('id', flat=True))
+        # in-stock products only, so checkout measures the happy path
+        product_ids = list(
+            Product.objects.filter(stock__gte=50).order_by('?').values_list('id', flat=True)[:10000]
+        )
+        if not users or not product_ids or not menu_ids:
+            raise CommandError("No benchmark data; run manage.py seed_benchmark first")
+        tokens = {u.id: Token.objects.get_or_create(user=u)[0].key for u in users}
+
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'workers': options['workers'],
+                'requests': options['requests'],
+                'products': Product.objects.count(),
+                'users': User.objects.count(),
+            },
+            'scenarios': {},
+        }
+
+        for name in names:
+            scenario = SCENARIOS[name]
+            sampler = Sampler()
+
+            def worker(n, iterations):
+                user = users[n % len(users)]
+                session = Session(user, tokens[user.id], menu_ids, product_ids, options['seed'] + n)
+                try:
+                    for _ in range(options['warmup']):
+                        scenario(session)
+                    ready.wait()
+                    for _ in range(iterations):
+                        sampler.run(scenario, session)
+                except threading.BrokenBarrierError:
+                    pass  # another worker failed; its exception is reported below
+                except Exception:
+                    ready.abort()
+                    raise
+                finally:
+                    connections.close_all()  # each worker thread opened its own connection
+
+            workers = options['workers']
+            quotas = [options['requests'] // workers + (n < options['requests'] % workers) for n in range(workers)]
+            ready = threading.Barrier(workers + 1)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(worker, n, quota) for n, quota in enumerate(quotas)]
+                try:
+                    ready.wait()  # start the clock once every worker has warmed up
+                except threading.BrokenBarrierError:
+                    pass
+                started = time.perf_counter()
+                for future in futures:
+                    future.result()
+                wall = time.perf_counter() - started
+
+            report['scenarios'][name] = sampler.summary(wall)
+            self.stderr.write(self.format_row(name, report['scenarios'][name]))
+
+        if options['compare']:
+            with open(options['compare']) as fh:
+                report['compare'] = self.compare(json.load(fh), report)
+            for name, delta in report['compare'].items():
+                self.stderr.write(f"{name:<14} p95 {delta['p95_change']:>+8.1%}  "
+                                  f"rps {delta['throughput_change']:>+8.1%}  "
+                                  f"queries {delta['queries_change']:>+6}")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def format_row(self, name, row):
+        latency = row['latency_ms']
+        return (f"{name:<14} {row['requests']:>6} req  {row['throughput_rps']:>8} rps  "
+                f"p50 {latency.get('p50')} p95 {latency.get('p95')} p99 {latency.get('p99')} ms  "
+                f"{row['queries_per_request']} q/req  {row['errors']} errors")
+
+    def compare(self, baseline, report):
+        def change(old, new):
+            return round((new - old) / old, 4) if old else 0.0
+
+        deltas = {}
+        for name, row in report['scenarios'].items():
+            old = baseline.get('scenarios', {}).get(name)
+            if not old:
+                continue
+            deltas[name] = {
+                'baseline_commit': baseline.get('meta', {}).get('commit'),
+                'p95_change': change(old['latency_ms']['p95'], row['latency_ms']['p95']),
+                'p99_change': change(old['latency_ms']['p99'], row['latency_ms']['p99']),
+                'throughput_change': change(old['throughput_rps'], row['throughput_rps']),
+                'queries_change': round((row['queries_per_request'] or 0) - (old['queries_per_request'] or 0), 2),
+            }
+        return deltas
@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+
+from products import idempotency
+from products.tasks import prune, run_due, worker_name
+
+PRUNE_EVERY = 60 * 60
+
+
+def work(stop, batch_size, poll):
+    """Worker process: claim and run batches until told to stop"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent owns shutdown; finish the batch in hand
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    worker = worker_name()
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            claimed = run_due(worker, batch_size)
+        except Exception:
+            # e.g. the database went away: back off instead of spinning
+            connections.close_all()
+            claimed = 0
+            stop.wait(poll * 5)
+        if claimed < batch_size:
+            stop.wait(poll)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Run background task workers (products.tasks): a pool of processes polling the Task table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help="Worker processes")
+        parser.add_argument('--batch-size', type=int, default=10, help="Tasks claimed per poll")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Run everything due in this process, then exit (cron, tests)")
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--processes and --batch-size must be positive")
+
+        if options['once']:
+            worker, total = worker_name(), 0
+            while True:
+                claimed = run_due(worker, options['batch_size'])
+                total += claimed
+                if not claimed:
+                    break
+            self.stdout.write(self.style.SUCCESS(f"Ran {total} tasks"))
+            return
+
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        args = (stop, options['batch_size'], options['poll'])
+        connections.close_all()  # children must not share the parent's sockets
+
+        # only note the signal here: setting the Event from a handler can deadlock
+        # with the main thread waiting on it
+        stopping = []
+
+        def shutdown(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        processes = [context.Process(target=work, args=args, daemon=True) for _ in range(options['processes'])]
+        for process in processes:
+            process.start()
+        self.stderr.write(f"Started {len(processes)} workers")
+
+        last_prune = 0
+        while not stopping:
+            # replace workers that died (OOM, segfault in a C extension...)
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    self.stderr.write(f"Worker {process.pid} exited with {process.exitcode}, restarting")
+                    processes[i] = context.Process(target=work, args=args, daemon=True)
+                    processes[i].start()
+            if time.monotonic() - last_prune > PRUNE_EVERY:
+                pruned = prune(settings.TASK_KEEP_DONE_DAYS)
+                expired = idempotency.prune()
+                connections.close_all()
+                if pruned or expired:
+                    self.stderr.write(f"Pruned {pruned} finished tasks, {expired} expired idempotency keys")
+                last_prune = time.monotonic()
+            time.sleep(1)
+
+        self.stderr.write("Stopping workers after their current batch...")
+        stop.set()
+        for process in processes:
+            process.join()
@@ -0,0 +1,167 @@
+import datetime
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts.models import Profile
+from products.bench import WORDS, synthetic_products
+from products.cache import bump
+from products.models import Cart, CartItem, Favourite, Menu, Order, OrderItem, Product, Review
+
+BENCH_PASSWORD = 'bench-password'
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate a realistic catalogue, users, carts, reviews and orders for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000)
+        parser.add_argument('--menus', type=int, default=8, help="Top-level menus")
+        parser.add_argument('--submenus', type=int, default=5, help="Submenus per top-level menu")
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--carts', type=int, default=5_000, help="Users with a non-empty cart")
+        parser.add_argument('--reviews', type=int, default=200_000)
+        parser.add_argument('--favourites', type=int, default=50_000)
+        parser.add_argument('--orders', type=int, default=100_000)
+        parser.add_argument('--days', type=int, default=120, help="Spread orders/reviews over this many days")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Product.objects.filter(sku__startswith='bench-').exists():
+            raise CommandError("Benchmark data already present (products with sku bench-*); use a fresh database")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+
+        menu_ids = self.step('menus', self.seed_menus, options['menus'], options['submenus'])
+        product_ids = self.step('products', self.seed_products, options['products'], menu_ids, options['seed'])
+        user_ids = self.step('users', self.seed_users, options['users'])
+        self.step('carts', self.seed_carts, user_ids[:options['carts']], product_ids)
+        self.step('favourites', self.seed_favourites, options['favourites'], user_ids, product_ids)
+        self.step('reviews', self.seed_reviews, options['reviews'], user_ids, product_ids)
+        self.step('orders', self.seed_orders, options['orders'], user_ids, product_ids)
+
+        # bulk_create sends no signals: rebuild everything the receivers maintain
+        self.step('menu closure', call_command, 'rebuild_menu_closure')
+        self.step('ratings', call_command, 'rebuild_ratings')
+        self.step('sales rollup', call_command, 'backfill_sales')
+        self.step('order summaries', call_command, 'rebuild_order_summaries')
+        self.step('related products', call_command, 'build_related_products', full=True)
+        self.step('search index', call_command, 'rebuild_search_index', missing_only=True)
+        bump('menu', 'product', 'review')
+        self.stdout.write(self.style.SUCCESS(f"Done. Bench users log in with password {BENCH_PASSWORD!r}"))
+
+    def step(self, name, fn, *args, **kwargs):
+        started = time.monotonic()
+        result = fn(*args, **kwargs)
+        self.stderr.write(f"{name}: {time.monotonic() - started:.1f}s")
+        return result
+
+    def random_time(self):
+        return self.now - datetime.timedelta(seconds=self.rng.randint(0, self.days * 86400))
+
+    def seed_menus(self, menus, submenus):
+        words = self.rng.sample(WORDS, min(len(WORDS), menus))
+        parents = Menu.objects.bulk_create([Menu(name=w.title()) for w in words])
+        children = Menu.objects.bulk_create([
+            Menu(name=f'{parent.name} {self.rng.choice(WORDS).title()} {n + 1}', parent=parent)
+            for parent in parents for n in range(submenus)
+        ])
+        return [m.id for m in parents + children]
+
+    def seed_products(self, count, menu_ids, seed):
+        for batch in batched(synthetic_products(0, count, menu_ids, seed), self.batch_size):
+            Product.objects.bulk_create(batch)
+        return list(Product.objects.filter(sku__startswith='bench-').values_list('id', flat=True))
+
+    def seed_users(self, count):
+        password = make_password(BENCH_PASSWORD)  # hash once, not per user
+        users = (
+            User(username=f'bench-user-{n}', email=f'bench-user-{n}@example.com', password=password)
+            for n in range(count)
+        )
+        for batch in batched(users, self.batch_size):
+            created = User.objects.bulk_create(batch)
+            Profile.objects.bulk_create([Profile(user=u) for u in created])
+        return list(User.objects.filter(username__startswith='bench-user-').values_list('id', flat=True))
+
+    def seed_carts(self, user_ids, product_ids):
+        carts = Cart.objects.bulk_create([Cart(user_id=uid) for uid in user_ids], batch_size=self.batch_size)
+        items = (
+            CartItem(cart=cart, product_id=pid, quantity=self.rng.randint(1, 3))
+            for cart in carts
+            for pid in self.rng.sample(product_ids, self.rng.randint(1, 6))
+        )
+        for batch in batched(items, self.batch_size):
+            CartItem.objects.bulk_create(batch)
+
+    def seed_favourites(self, count, user_ids, product_ids):
+        favs = (
+            Favourite(user_id=self.rng.choice(user_ids), product_id=self.rng.choice(product_ids))
+            for _ in range(count)
+        )
+        for batch in batched(favs, self.batch_size):
+            Favourite.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def seed_reviews(self, count, user_ids, product_ids):
+        # skew towards a popular head of the catalogue, like real traffic
+        head = product_ids[:max(1, len(product_ids) // 20)]
+        reviews = (
+            Review(
+                user_id=self.rng.choice(user_ids),
+                product_id=self.rng.choice(head if self.rng.random() < 0.7 else product_ids),
+                rating=self.rng.choices((1, 2, 3, 4, 5), weights=(5, 5, 15, 35, 40))[0],
+                comment=' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(3, 25))),
+                created_at=self.random_time(),
+            )
+            for _ in range(count)
+        )
+        for batch in batched(reviews, self.batch_size):
+            Review.objects.bulk_create(batch)
+
+    def seed_orders(self, count, user_ids, product_ids):
+        prices = {}
+        head = product_ids[:max(1, len(product_ids) // 20)]
+        statuses = [s for s, _ in Order.STATUS_CHOICES]
+        for batch_start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - batch_start)
+            lines = []
+            orders = []
+            for _ in range(size):
+                picked = {
+                    self.rng.choice(head if self.rng.random() < 0.6 else product_ids): self.rng.randint(1, 4)
+                    for _ in range(self.rng.randint(1, 5))
+                }
+                lines.append(picked)
+                orders.append(Order(
+                    user_id=self.rng.choice(user_ids),
+                    status=self.rng.choices(statuses, weights=(10, 10, 20, 55, 5))[0],
+                    total_amount=0,
+                    created_at=self.random_time(),
+                ))
+            missing = {pid for picked in lines for pid in picked} - prices.keys()
+            prices.update(Product.objects.filter(id__in=missing).values_list('id', 'price'))
+
+            for order, picked in zip(orders, lines):
+                order.total_amount = sum(prices[pid] * qty for pid, qty in picked.items())
+            orders = Order.objects.bulk_create(orders)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=pid, quantity=qty, price=prices[pid])
+                for order, picked in zip(orders, lines)
+                for pid, qty in picked.items()
+            ], batch_size=self.batch_size)
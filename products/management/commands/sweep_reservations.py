@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from products.reservations import SWEEP_BATCH_SIZE, sweep
+
+
+class Command(BaseCommand):
+    help = "Give expired stock holds (products.reservations) back to available stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help="Holds released per statement")
+        parser.add_argument('--every', type=float, help="Keep running, sweeping every this many seconds")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or (options['every'] is not None and options['every'] <= 0):
+            raise CommandError("--batch-size and --every must be positive")
+        while True:
+            close_old_connections()
+            swept = sweep(options['batch_size'])
+            if options['every'] is None:
+                self.stdout.write(self.style.SUCCESS(f"Released {swept} expired holds"))
+                return
+            if swept:
+                self.stderr.write(f"Released {swept} expired holds")
+            time.sleep(options['every'])
@@ -0,0 +1,96 @@
+"""
+Menu tree closure table.
+
+MenuClosure holds every (ancestor, descendant) pair, so "everything under
+menu X at any depth" is one indexed lookup (Menu.subtree_ids) instead of
+one query per level. The receivers below keep it in step when a menu is
+created or moved; deletes cascade. Writes that send no signals
+(bulk_create, queryset update of parent) need manage.py rebuild_menu_closure.
+"""
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Menu, MenuClosure, Product
+
+
+def _table():
+    return connection.ops.quote_name(MenuClosure._meta.db_table)
+
+
+def insert_node(menu_id, parent_id):
+    """Link a new menu to itself and to every ancestor of its parent"""
+    table = _table()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+            f'SELECT ancestor_id, %s, depth + 1 FROM {table} WHERE descendant_id = %s '
+            f'UNION ALL SELECT %s, %s, 0',
+            [menu_id, parent_id, menu_id, menu_id],
+        )
+
+
+def move_subtree(menu_id, new_parent_id):
+    """Re-hang the subtree rooted at ``menu_id`` under ``new_parent_id`` (None: make it top-level)"""
+    table = _table()
+    # Menu.save has already refused moves under the menu's own subtree
+    with transaction.atomic(), connection.cursor() as cursor:
+        # cut the subtree loose from its old ancestors, keeping the links inside it
+        cursor.execute(
+            f'DELETE FROM {table} WHERE descendant_id IN (SELECT descendant_id FROM {table} WHERE ancestor_id = %s) '
+            f'AND ancestor_id NOT IN (SELECT descendant_id FROM {table} WHERE ancestor_id = %s)',
+            [menu_id, menu_id],
+        )
+        if new_parent_id is not None:
+            # every new ancestor x every node of the subtree
+            cursor.execute(
+                f'INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+                f'SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1 '
+                f'FROM {table} above CROSS JOIN {table} below '
+                f'WHERE above.descendant_id = %s AND below.ancestor_id = %s',
+                [new_parent_id, menu_id],
+            )
+
+
+@transaction.atomic
+def rebuild():
+    """Recompute the whole closure table from Menu.parent; returns the number of pairs"""
+    table = _table()
+    menus = connection.ops.quote_name(Menu._meta.db_table)
+    MenuClosure.objects.all().delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH RECURSIVE paths (ancestor_id, descendant_id, depth) AS ('
+            f'SELECT id, id, 0 FROM {menus} '
+            f'UNION ALL '
+            f'SELECT paths.ancestor_id, child.id, paths.depth + 1 '
+            f'FROM paths JOIN {menus} child ON child.parent_id = paths.descendant_id'
+            f') INSERT INTO {table} (ancestor_id, descendant_id, depth) '
+            f'SELECT ancestor_id, descendant_id, depth FROM paths',
+        )
+        return cursor.rowcount
+
+
+def product_counts():
+    """{menu id: products in the menu and all its submenus}"""
+    direct = dict(
+        Product.objects.filter(menu__isnull=False).values('menu_id')
+        .annotate(n=Count('id')).order_by().values_list('menu_id', 'n')
+    )
+    counts = {}
+    # the closure table is tiny next to Product: roll the per-menu counts up in Python
+    for ancestor_id, descendant_id in MenuClosure.objects.values_list('ancestor_id', 'descendant_id'):
+        counts[ancestor_id] = counts.get(ancestor_id, 0) + direct.get(descendant_id, 0)
+    return counts
+
+
+@receiver(post_save, sender=Menu)
+def maintain_closure(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        insert_node(instance.id, instance.parent_id)
+    elif hasattr(instance, '_loaded_parent_id') and instance._loaded_parent_id != instance.parent_id:
+        move_subtree(instance.id, instance.parent_id)
+    instance._loaded_parent_id = instance.parent_id
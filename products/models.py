@@ -1,5 +1,12 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 
 # --- Product ---
@@ -8,9 +15,53 @@ class Menu(models.Model):
     image = models.ImageField(upload_to='menu/', blank=True, null=True)  # for hero/thumbnail
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children')
     # parent=null means main menu; otherwise submenu
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance.__dict__.get('parent_id')
+        return instance
+
+    def moves_under_itself(self):
+        return bool(self.pk and self.parent_id) and MenuClosure.objects.filter(
+            ancestor_id=self.pk, descendant_id=self.parent_id).exists()
+
+    def clean(self):
+        if self.moves_under_itself():
+            raise ValidationError({'parent': "A menu can't be moved under itself or one of its submenus."})
+
+    def save(self, *args, **kwargs):
+        if self.parent_id != getattr(self, '_loaded_parent_id', self.parent_id) and self.moves_under_itself():
+            raise ValueError("A menu can't be moved under itself or one of its submenus")
+        with transaction.atomic():  # together with the closure rows products.menus writes on post_save
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def subtree_ids(cls, menu_id):
+        """ids of the menu and all of its submenus at any depth, as a subquery for ``menu_id__in``"""
+        return MenuClosure.objects.filter(ancestor_id=menu_id).values('descendant_id')
+
+
+class MenuClosure(models.Model):
+    """
+    Every (ancestor, descendant) pair of the menu tree, each menu paired with
+    itself at depth 0, kept in step with Menu.parent by products.menus.
+    """
+    ancestor = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='descendant_links', db_index=False)
+    descendant = models.ForeignKey(Menu, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='menu_closure_pair'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} > {self.descendant_id} ({self.depth})"
     
 class HerosectionImages(models.Model):
     image = models.ImageField(upload_to='hero/', blank=True, null=True)
@@ -18,20 +69,71 @@ class HerosectionImages(models.Model):
 
 class Product(models.Model):
     menu = models.ForeignKey(Menu, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)  # supplier key for bulk imports
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(default=0)  # units held by StockReservation rows, see products.reservations
     description = models.TextField(blank=True)
     image = models.ImageField(upload_to='src/', blank=True, null=True)  # for hero/thumbnail
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # incremental exports, Last-Modified
+
+    # denormalised review aggregates, kept current by the Review signals below
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(default=0, db_index=True)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    # weighted name/description tsvector, kept current by products.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector'),
+            # typo tolerant name matching, needs the pg_trgm extension (see ProductsConfig)
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+            # category listing and (price, id) keyset pagination
+            models.Index(fields=['menu', 'id'], name='product_menu_id'),
+            models.Index(fields=['price', 'id'], name='product_price_id'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @property
+    def available(self):
+        """units that can still be added to a cart: stock not held by anyone"""
+        return max(self.stock - self.reserved, 0)
+
+    @property
+    def rating_histogram(self):
+        return [(star, getattr(self, f'rating_{star}')) for star in range(5, 0, -1)]
+
+    @classmethod
+    def apply_rating_delta(cls, product_id, rating, sign):
+        """add (sign=1) or remove (sign=-1) one review's rating in a single UPDATE"""
+        bucket = f'rating_{min(max(rating, 1), 5)}'
+        count = F('rating_count') + sign
+        total = F('rating_sum') + sign * rating
+        cls.objects.filter(id=product_id).update(**{
+            'rating_count': count,
+            'rating_sum': total,
+            'rating_avg': Coalesce(Cast(total, FloatField()) / NullIf(count, 0), Value(0.0)),
+            bucket: F(bucket) + sign,
+            'updated_at': Now(),
+        })
+
 
 # --- Cart ---
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(default=timezone.now)
+    # stamped by every item change in products.cart; incremental related-products runs key off it
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Cart {self.id} for {self.user.username}"
@@ -41,10 +143,35 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # one row per product per cart, so concurrent get_or_create cannot duplicate it
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
 
+# --- Stock reservations ---
+class StockReservation(models.Model):
+    """units of a product held for one cart until expires_at (see products.reservations)"""
+    holder = models.CharField(max_length=64)  # 'user:<id>' or 'session:<token>'
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['holder', 'product'], name='stock_reservation_holder_product'),
+        ]
+        indexes = [models.Index(fields=['expires_at'], name='stock_reservation_expiry')]
+
+    def __str__(self):
+        return f"{self.holder} holds {self.quantity} x {self.product_id} until {self.expires_at}"
+
+
 # --- Favourites ---
 class Favourite(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -66,9 +193,42 @@ class Review(models.Model):
     comment = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['product', 'created_at'], name='review_product_created')]
+
     def __str__(self):
         return f"{self.user.username} review for {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what is counted in the product aggregates
+        instance._counted = (instance.__dict__.get('product_id'), instance.__dict__.get('rating'))
+        return instance
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_counted', None)
+    if not created and old is None:
+        return  # previous state unknown; rebuild_ratings corrects it
+    new = (instance.product_id, int(instance.rating))
+    if old == new:
+        return
+    if old and None not in old:
+        Product.apply_rating_delta(old[0], int(old[1]), -1)
+    Product.apply_rating_delta(new[0], new[1], 1)
+    instance._counted = new
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    old = getattr(instance, '_counted', (instance.product_id, instance.rating))
+    if None not in old:
+        Product.apply_rating_delta(old[0], int(old[1]), -1)
+
 
 # --- Order ---
 class Order(models.Model):
@@ -85,9 +245,18 @@ class Order(models.Model):
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'], name='order_user_created')]
+
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -98,6 +267,118 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
 
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_cancel(sender, instance, created, raw=False, **kwargs):
+    old_status = getattr(instance, '_loaded_status', None)
+    instance._loaded_status = instance.status
+    if raw or created or old_status is None or old_status == instance.status:
+        return
+    from .tasks import enqueue, record_order_sales
+    if instance.status == 'cancelled':
+        enqueue(record_order_sales, order_id=instance.id, sign=-1)
+    elif old_status == 'cancelled':
+        enqueue(record_order_sales, order_id=instance.id, sign=1)
+
+
+# --- Order status log ---
+class OrderStatusChange(models.Model):
+    """one row per order moved by a fulfilment run (products.fulfilment)"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_changes')
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    batch = models.UUIDField(db_index=True)  # every order moved by the same run
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['order', 'created_at'], name='order_status_change_order')]
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
+
+
+# --- Related products ---
+class RelatedProduct(models.Model):
+    """top-K products bought, carted or favourited together with ``product``, written by products.related"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+', db_index=False)
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_in')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # also the index the detail page reads through: WHERE product_id = ? ORDER BY rank
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+# --- Order summary ---
+class OrderSummary(models.Model):
+    """
+    What the order history pages show, one row per order, so a page of history
+    is one indexed read instead of joins across items, products, shipping and
+    payment. Rewritten by products.orders.refresh_summaries whenever the order,
+    its items, shipping or payment change.
+    """
+    SHIPPING_STATUS_CHOICES = (
+        ('none', 'No address yet'),
+        ('pending', 'Awaiting shipment'),
+        ('shipped', 'Shipped'),
+    )
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    line_count = models.PositiveIntegerField(default=0)
+    unit_count = models.PositiveIntegerField(default=0)
+    first_item_name = models.CharField(max_length=255, blank=True)
+    first_item_image = models.CharField(max_length=255, blank=True)  # storage name of the product image
+    payment_method = models.CharField(max_length=20, blank=True)
+    payment_status = models.CharField(max_length=20, blank=True)  # blank until a payment is started
+    shipping_status = models.CharField(max_length=10, choices=SHIPPING_STATUS_CHOICES, default='none')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-order'], name='order_summary_history'),
+        ]
+
+    def __str__(self):
+        return f"Summary of order {self.order_id}"
+
+    @property
+    def other_line_count(self):
+        return max(self.line_count - 1, 0)
+
+
+# --- Sales rollup ---
+class ProductSalesDaily(models.Model):
+    """units sold per product per day, maintained from OrderItem by products.sales"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # the rollup's watermark (products.sales.watermark): every upsert stamps it
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = ('product', 'date')
+        indexes = [models.Index(fields=['date', 'product'], name='sales_daily_date_product')]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.date}: {self.quantity}"
+
 
 # --- Shipping ---
 class Shipping(models.Model):
@@ -139,3 +420,55 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Payment for Order {self.order.id} - {self.status}"
+
+
+# --- Task queue ---
+class Task(models.Model):
+    """a unit of background work, run by manage.py run_workers (see products.tasks)"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)  # not before; pushed back on each retry
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # only unfinished tasks are ever polled, so the index stays small however long history gets
+            models.Index(fields=['run_at', 'id'], name='task_pending_run_at',
+                         condition=models.Q(status__in=['queued', 'running'])),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+
+# --- Idempotency keys ---
+class IdempotencyKey(models.Model):
+    """the response to a POST sent with an Idempotency-Key header, replayed on retries (products.idempotency)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(default=0)  # 0 until the first request finishes
+    response = models.JSONField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key')]
+        indexes = [models.Index(fields=['expires_at'], name='idempotency_expiry')]
+
+    def __str__(self):
+        return f"{self.user_id}:{self.key} -> {self.status_code}"
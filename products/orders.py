@@ -0,0 +1,124 @@
+"""
+Order history read model.
+
+OrderSummary keeps one row per order with everything the history pages
+show. Checkout writes it in the order's own transaction; later changes to
+the order, its items, shipping or payment rewrite it once they commit.
+Bulk writes that send no signals (queryset update(), bulk_create) must call
+refresh_summaries themselves.
+"""
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Order, OrderItem, OrderSummary, Payment, Shipping
+from .pagination import decode_cursor, encode_cursor
+
+HISTORY_PAGE_SIZE = 20
+
+SUMMARY_FIELDS = [
+    'user', 'status', 'total_amount', 'created_at', 'line_count', 'unit_count',
+    'first_item_name', 'first_item_image', 'payment_method', 'payment_status', 'shipping_status',
+]
+
+
+def _shipping_status(order):
+    shipping = getattr(order, 'shipping', None)
+    if shipping is None:
+        return 'none'
+    return 'shipped' if shipping.shipped_at else 'pending'
+
+
+def refresh_summaries(order_ids):
+    """Rewrite the summaries of ``order_ids`` (three queries and one upsert, however many)"""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return 0
+    counts = {
+        row['order_id']: row for row in
+        OrderItem.objects.filter(order_id__in=order_ids).values('order_id')
+        .annotate(lines=Count('id'), units=Sum('quantity')).order_by()
+    }
+    first_items = {
+        row['order_id']: row for row in
+        OrderItem.objects.filter(order_id__in=order_ids).order_by('order_id', 'id')
+        .distinct('order_id').values('order_id', 'product__name', 'product__image')
+    }
+    rows = []
+    for order in Order.objects.filter(id__in=order_ids).select_related('shipping', 'payment'):
+        count = counts.get(order.id, {})
+        first = first_items.get(order.id, {})
+        payment = getattr(order, 'payment', None)
+        rows.append(OrderSummary(
+            order=order,
+            user_id=order.user_id,
+            status=order.status,
+            total_amount=order.total_amount,
+            created_at=order.created_at,
+            line_count=count.get('lines', 0),
+            unit_count=count.get('units') or 0,
+            first_item_name=first.get('product__name') or '',
+            first_item_image=first.get('product__image') or '',
+            payment_method=payment.method if payment else '',
+            payment_status=payment.status if payment else '',
+            shipping_status=_shipping_status(order),
+        ))
+    OrderSummary.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['order'], update_fields=SUMMARY_FIELDS,
+    )
+    return len(rows)
+
+
+def refresh_summaries_on_commit(order_ids):
+    order_ids = list(order_ids)
+    transaction.on_commit(lambda: refresh_summaries(order_ids))
+
+
+def backfill_summaries(chunk_size=2000):
+    """Write the summary of every order; returns how many"""
+    written = 0
+    ids = []
+    for order_id in Order.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+        ids.append(order_id)
+        if len(ids) >= chunk_size:
+            written += refresh_summaries(ids)
+            ids = []
+    return written + refresh_summaries(ids)
+
+
+def history_page(user, cursor=None, limit=HISTORY_PAGE_SIZE):
+    """
+    (summaries, next_cursor) for one page of ``user``'s orders, newest first,
+    keyed on (created_at, order id) so every page costs the same however far back.
+    Raises InvalidCursor.
+    """
+    summaries = OrderSummary.objects.filter(user=user)
+    if cursor:
+        created_at, pk = decode_cursor(cursor, 'created_at')
+        summaries = summaries.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, order_id__lt=pk))
+    # one extra row tells whether there is a next page
+    page = list(summaries.order_by('-created_at', '-order')[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].order_id)
+    return page, next_cursor
+
+
+# --- Receivers ---
+# checkout writes the summary of a new order itself, once its items exist
+@receiver(post_save, sender=Order)
+def refresh_on_order_save(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        refresh_summaries_on_commit([instance.id])
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+@receiver(post_save, sender=Shipping)
+@receiver(post_save, sender=Payment)
+def refresh_on_related_change(sender, instance, raw=False, **kwargs):
+    # on commit, so items deleted along with their order don't resurrect its summary
+    if not raw:
+        refresh_summaries_on_commit([instance.order_id])
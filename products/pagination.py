@@ -0,0 +1,100 @@
+import base64
+import datetime
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+
+# sort key -> (model field, descending)
+SORT_KEYS = {
+    'id': ('id', False),
+    '-id': ('id', True),
+    'price': ('price', False),
+    '-price': ('price', True),
+    'name': ('name', False),
+    '-name': ('name', True),
+    'rating': ('rating_avg', False),
+    '-rating': ('rating_avg', True),
+}
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk):
+    """Opaque cursor for the last row of a page: (sort value, id)."""
+    if isinstance(value, Decimal):
+        value = str(value)
+    elif isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        pk = int(pk)
+        if field == 'price':
+            value = Decimal(value)
+        elif field == 'id':
+            value = int(value)
+        elif field == 'rating_avg':
+            value = float(value)
+        elif field == 'created_at':
+            value = datetime.datetime.fromisoformat(value)
+        elif not isinstance(value, str):
+            raise InvalidCursor(cursor)
+    except (ValueError, TypeError, InvalidOperation):
+        raise InvalidCursor(cursor)
+    return value, pk
+
+
+def parse_page_size(raw):
+    try:
+        size = int(raw) if raw else DEFAULT_PAGE_SIZE
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def keyset_page(queryset, fields, sort='id', cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Return (rows, next_cursor) for one page of ``queryset`` ordered by
+    (sort field, id). Rows are dicts limited to ``fields``; the columns the
+    cursor needs are fetched too and stripped again before returning.
+    """
+    field, descending = SORT_KEYS[sort]
+    order = [f'-{field}', '-id'] if descending else [field, 'id']
+
+    if cursor:
+        value, pk = decode_cursor(cursor, field)
+        op = 'lt' if descending else 'gt'
+        if field == 'id':
+            queryset = queryset.filter(**{f'id__{op}': pk})
+        else:
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': pk})
+            )
+
+    columns = list(fields)
+    extra = [c for c in ('id', field) if c not in columns]
+    # fetch one extra row to know whether there is a next page
+    rows = list(queryset.order_by(*order).values(*columns, *extra)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[field], last['id'])
+
+    if extra:
+        for row in rows:
+            for c in extra:
+                row.pop(c, None)
+    return rows, next_cursor
@@ -0,0 +1,123 @@
+"""
+"Customers also bought": product co-occurrence across orders, carts and
+favourites, precomputed into RelatedProduct by manage.py build_related_products.
+
+Every order, cart and user's favourites list is a basket. Two products score
+by how often they share a basket, weighted by kind (an order says more than
+a cart), normalised by how common each product is (cosine), so best sellers
+don't end up related to everything. The counting is one set-based statement
+in Postgres: the sparse product x product matrix only exists as GROUP BY
+output, and only each product's top K survive into the table.
+
+An incremental run recomputes only the products that appear in orders,
+carts or favourites since the last run (a cart counts when any of its items
+changed); the scores of other products, including ones just taken out of a
+cart, drift slightly until the next full run.
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Cart, CartItem, Favourite, Order, OrderItem, Product, RelatedProduct
+
+TOP_K = 20
+MIN_SUPPORT = 2       # weighted co-occurrences needed before a pair counts at all
+MAX_BASKET = 50       # larger baskets (bulk orders, hoarded favourites) say little and cost size^2
+WEIGHTS = {'order': 3, 'cart': 1, 'favourite': 2}
+OVERLAP = timedelta(minutes=10)  # re-read a little before the watermark: rows commit after they're stamped
+
+
+def _sql(scoped):
+    qn = connection.ops.quote_name
+    scope = 'WHERE a.product_id = ANY(%(products)s)' if scoped else ''
+    return f"""
+        WITH items AS (
+            SELECT 1 AS kind, order_id AS basket, product_id, %(w_order)s::float AS weight
+            FROM {qn(OrderItem._meta.db_table)}
+            UNION ALL
+            SELECT 2, cart_id, product_id, %(w_cart)s FROM {qn(CartItem._meta.db_table)}
+            UNION ALL
+            SELECT 3, user_id, product_id, %(w_favourite)s FROM {qn(Favourite._meta.db_table)}
+        ), sized AS (
+            SELECT kind, basket, product_id, weight,
+                   count(*) OVER (PARTITION BY kind, basket) AS size
+            FROM items
+        ), baskets AS (
+            SELECT kind, basket, product_id, weight FROM sized WHERE size BETWEEN 2 AND %(max_basket)s
+        ), freq AS (
+            SELECT product_id, sum(weight) AS n FROM baskets GROUP BY product_id
+        ), pairs AS (
+            SELECT a.product_id, b.product_id AS related_id, sum(a.weight) AS together
+            FROM baskets a
+            JOIN baskets b ON b.kind = a.kind AND b.basket = a.basket AND b.product_id <> a.product_id
+            {scope}
+            GROUP BY a.product_id, b.product_id
+            HAVING sum(a.weight) >= %(min_support)s
+        ), ranked AS (
+            SELECT p.product_id, p.related_id, p.together / sqrt(fa.n * fb.n) AS score,
+                   row_number() OVER (
+                       PARTITION BY p.product_id
+                       ORDER BY p.together / sqrt(fa.n * fb.n) DESC, p.together DESC, p.related_id
+                   ) AS rank
+            FROM pairs p
+            JOIN freq fa ON fa.product_id = p.product_id
+            JOIN freq fb ON fb.product_id = p.related_id
+        )
+        INSERT INTO {qn(RelatedProduct._meta.db_table)} (product_id, related_id, rank, score, computed_at)
+        SELECT product_id, related_id, rank, score, %(now)s FROM ranked WHERE rank <= %(top_k)s
+    """
+
+
+def changed_products(since):
+    """ids of products in orders, favourites or carts created or changed since ``since``"""
+    ids = set(OrderItem.objects.filter(
+        order_id__in=Order.objects.filter(created_at__gte=since).values('id')).values_list('product_id', flat=True))
+    ids.update(CartItem.objects.filter(
+        cart_id__in=Cart.objects.filter(updated_at__gte=since).values('id')).values_list('product_id', flat=True))
+    ids.update(Favourite.objects.filter(added_at__gte=since).values_list('product_id', flat=True))
+    return ids
+
+
+def last_run():
+    return RelatedProduct.objects.aggregate(at=Max('computed_at'))['at']
+
+
+@transaction.atomic
+def build(full=False, top_k=TOP_K):
+    """
+    Recompute related products; everything if ``full`` or never run before,
+    otherwise only products with new activity. Returns (products considered, rows written).
+    """
+    started = timezone.now()
+    since = None if full else last_run()
+    params = {
+        'w_order': WEIGHTS['order'], 'w_cart': WEIGHTS['cart'], 'w_favourite': WEIGHTS['favourite'],
+        'max_basket': MAX_BASKET, 'min_support': MIN_SUPPORT, 'top_k': top_k, 'now': started,
+    }
+    if since is None:
+        RelatedProduct.objects.all().delete()
+        considered = Product.objects.count()
+    else:
+        products = sorted(changed_products(since - OVERLAP))
+        if not products:
+            return 0, 0
+        RelatedProduct.objects.filter(product_id__in=products).delete()
+        params['products'] = products
+        considered = len(products)
+    with connection.cursor() as cursor:
+        cursor.execute(_sql(scoped=since is not None), params)
+        written = cursor.rowcount
+    return considered, written
+
+
+# --- Reading ---
+def related_queryset(product_id):
+    """The precomputed list, best first: one lookup on the (product, rank) index joined to Product"""
+    return Product.objects.filter(recommended_in__product_id=product_id).order_by('recommended_in__rank')
+
+
+def fallback_queryset(product, exclude_ids):
+    """Same-menu products, for products without (enough) co-occurrence data yet"""
+    return Product.objects.filter(menu_id=product.menu_id).exclude(id__in=[product.id, *exclude_ids])
@@ -0,0 +1,205 @@
+"""
+Stock holds.
+
+Putting a product in a cart holds those units for STOCK_HOLD_MINUTES, so the
+last units can't be sold to someone else while the first shopper checks out.
+Product.reserved counts the units held by StockReservation rows; what is
+left to sell is stock - reserved (Product.available), read from the product
+row itself without summing holds.
+
+A hold is taken or changed with one conditional UPDATE of the product
+(reserved + n only while stock covers it), so concurrent shoppers can't
+both get the last unit. Checkout consumes the shopper's holds in its own
+stock UPDATE. Expired holds keep counting until manage.py sweep_reservations
+deletes them in batches and gives their units back.
+
+Holders are 'user:<id>' for signed-in users (web and API share one set of
+holds) and 'session:<token>' for anonymous carts; login moves the latter
+onto the former.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested, available):
+        super().__init__('Insufficient stock')
+        self.line = {'product_id': product_id, 'requested': requested, 'available': available}
+
+
+def user_holder(user):
+    return f'user:{user.id}'
+
+
+def session_holder(token):
+    return f'session:{token}'
+
+
+def new_token():
+    return secrets.token_hex(16)
+
+
+def _tables():
+    qn = connection.ops.quote_name
+    return qn(StockReservation._meta.db_table), qn(Product._meta.db_table)
+
+
+def _expiry():
+    return timezone.now() + timedelta(minutes=settings.STOCK_HOLD_MINUTES)
+
+
+# --- Holding ---
+def _hold_sql():
+    holds, products = _tables()
+    return f"""
+        WITH previous AS (
+            SELECT id, quantity FROM {holds}
+            WHERE holder = %(holder)s AND product_id = %(product)s FOR UPDATE
+        ), claimed AS (
+            UPDATE {products} AS p SET reserved = GREATEST(p.reserved + %(quantity)s - previous.quantity, 0)
+            FROM previous
+            WHERE p.id = %(product)s
+              AND (%(quantity)s <= previous.quantity OR p.stock + previous.quantity >= p.reserved + %(quantity)s)
+            RETURNING previous.id
+        )
+        UPDATE {holds} AS h SET quantity = %(quantity)s, expires_at = %(expires)s
+        FROM claimed WHERE h.id = claimed.id
+        RETURNING h.id
+    """
+
+
+def holdable(holder, product_id):
+    """How many units ``holder`` could hold in all: what's free plus what they already hold"""
+    product = Product.objects.filter(id=product_id).values('stock', 'reserved').first()
+    if product is None:
+        return 0
+    held = StockReservation.objects.filter(holder=holder, product_id=product_id).values_list('quantity', flat=True)
+    # unclamped until the end, exactly like the guard in _hold_sql
+    return max(product['stock'] - product['reserved'] + (held.first() or 0), 0)
+
+
+def hold(holder, product_id, quantity):
+    """
+    Hold exactly ``quantity`` units of a product for ``holder`` (replacing any
+    earlier hold) for another STOCK_HOLD_MINUTES. Raises InsufficientStock, in
+    which case the earlier hold is left as it was.
+    """
+    if quantity <= 0:
+        return release(holder, [product_id])
+    holds, _ = _tables()
+    now = timezone.now()
+    params = {'holder': holder, 'product': product_id, 'quantity': quantity, 'expires': _expiry()}
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # an empty hold to lock, so two requests from the same cart take turns
+            cursor.execute(
+                f'INSERT INTO {holds} (holder, product_id, quantity, expires_at, created_at) '
+                f'VALUES (%s, %s, 0, %s, %s) ON CONFLICT (holder, product_id) DO NOTHING',
+                [holder, product_id, now, now],
+            )
+            cursor.execute(_hold_sql(), params)
+            claimed = cursor.fetchone()
+        if claimed is None:
+            transaction.set_rollback(True)
+    if claimed is None:
+        raise InsufficientStock(product_id, quantity, holdable(holder, product_id))
+
+
+def renew(holder):
+    """Push back the expiry of all of ``holder``'s holds, e.g. while they look at their cart"""
+    return StockReservation.objects.filter(holder=holder).update(expires_at=_expiry())
+
+
+def transfer(from_holder, to_holder):
+    """Move holds to another holder (anonymous cart -> user at login), adding up shared products"""
+    holds, _ = _tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {holds} WHERE holder = %(old)s '
+            f'RETURNING product_id, quantity, expires_at, created_at) '
+            f'INSERT INTO {holds} (holder, product_id, quantity, expires_at, created_at) '
+            f'SELECT %(new)s, product_id, quantity, expires_at, created_at FROM moved '
+            f'ON CONFLICT (holder, product_id) DO UPDATE SET '
+            f'quantity = {holds}.quantity + EXCLUDED.quantity, '
+            f'expires_at = GREATEST({holds}.expires_at, EXCLUDED.expires_at)',
+            {'old': from_holder, 'new': to_holder},
+        )
+        return cursor.rowcount
+
+
+def consume(holder, product_ids):
+    """
+    Delete ``holder``'s holds on ``product_ids`` without giving the units back:
+    {product_id: quantity}. For checkout, whose stock UPDATE takes the units out
+    of Product.reserved and Product.stock together; call it in that transaction.
+    """
+    holds, _ = _tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {holds} WHERE holder = %s AND product_id = ANY(%s) RETURNING product_id, quantity',
+            [holder, list(product_ids)],
+        )
+        return dict(cursor.fetchall())
+
+
+# --- Releasing ---
+def _release_sql(condition, skip_locked=False):
+    holds, products = _tables()
+    lock = 'FOR UPDATE SKIP LOCKED' if skip_locked else 'FOR UPDATE'
+    return f"""
+        WITH released AS (
+            DELETE FROM {holds} WHERE id IN (
+                SELECT id FROM {holds} WHERE {condition} ORDER BY id LIMIT %(limit)s {lock}
+            )
+            RETURNING product_id, quantity
+        ), totals AS (
+            SELECT product_id, sum(quantity) AS quantity, count(*) AS holds FROM released GROUP BY product_id
+        ), locked AS (
+            -- id order, like checkout, so the two can't deadlock on products
+            SELECT id FROM {products} WHERE id IN (SELECT product_id FROM totals) ORDER BY id FOR UPDATE
+        ), restored AS (
+            UPDATE {products} AS p SET reserved = GREATEST(p.reserved - totals.quantity, 0)
+            FROM totals WHERE p.id = totals.product_id AND p.id IN (SELECT id FROM locked)
+            RETURNING totals.holds
+        )
+        SELECT COALESCE(sum(holds), 0) FROM restored
+    """
+
+
+def _release(condition, params, skip_locked=False):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_release_sql(condition, skip_locked), params)
+        return cursor.fetchone()[0]
+
+
+def release(holder, product_ids=None):
+    """Give back ``holder``'s holds (on ``product_ids``, or all); returns how many holds"""
+    condition = 'holder = %(holder)s'
+    params = {'holder': holder, 'limit': None}
+    if product_ids is not None:
+        condition += ' AND product_id = ANY(%(products)s)'
+        params['products'] = list(product_ids)
+    return _release(condition, params)
+
+
+def sweep(batch_size=SWEEP_BATCH_SIZE):
+    """
+    Give back every expired hold, ``batch_size`` at a time; returns how many.
+    Holds being renewed or checked out right now are skipped, not waited for.
+    """
+    swept = 0
+    while True:
+        released = _release(
+            'expires_at <= %(now)s', {'now': timezone.now(), 'limit': batch_size}, skip_locked=True,
+        )
+        swept += released
+        if released < batch_size:
+            return swept
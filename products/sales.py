@@ -0,0 +1,138 @@
+import datetime
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import OrderItem, Product, ProductSalesDaily
+
+WINDOWS = (7, 30, 90)
+CACHE_TTL = 60 * 60
+# rows are stamped before they commit: a ranking built this soon after the newest
+# stamp may miss a write stamped just before it, so it is only kept this long
+SETTLE = datetime.timedelta(seconds=10)
+
+
+def _upsert_sql():
+    table = connection.ops.quote_name(ProductSalesDaily._meta.db_table)
+    return (
+        f'INSERT INTO {table} (product_id, date, quantity, revenue, updated_at) VALUES (%s, %s, %s, %s, %s) '
+        f'ON CONFLICT (product_id, date) DO UPDATE SET '
+        f'quantity = {table}.quantity + EXCLUDED.quantity, '
+        f'revenue = {table}.revenue + EXCLUDED.revenue, '
+        f'updated_at = EXCLUDED.updated_at'
+    )
+
+
+def record_sales(day, lines, sign=1):
+    """
+    Add (sign=1) or remove (sign=-1) sold units for one day.
+    lines: iterable of (product_id, quantity, unit price)
+    """
+    now = timezone.now()
+    params = [
+        (product_id, day, sign * qty, sign * qty * price, now)
+        for product_id, qty, price in lines
+    ]
+    if not params:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(), params)
+
+
+def record_order(order, sign=1):
+    lines = order.items.values_list('product_id', 'quantity', 'price')
+    record_sales(timezone.localdate(order.created_at), lines, sign)
+
+
+def record_orders(order_ids, sign=1):
+    """record_order for many orders at once: one grouped query, one batch of upserts"""
+    grouped = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('product_id', 'day')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('price')))
+        .order_by()
+    )
+    now = timezone.now()
+    params = [(row['product_id'], row['day'], sign * row['units'], sign * row['revenue'], now) for row in grouped]
+    if not params:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(), params)
+
+
+def watermark():
+    """
+    When the rollup last changed, read from the table (an indexed max) so the
+    web processes see the task workers' writes whatever cache they use.
+    """
+    return ProductSalesDaily.objects.aggregate(at=Max('updated_at'))['at']
+
+
+def watermark_key(stamp):
+    return stamp.isoformat() if stamp else 'empty'
+
+
+def best_seller_ids(days=30, limit=8):
+    """[(product_id, units)] for the trailing window, cached until the rollup changes"""
+    stamp = watermark()
+    today = timezone.localdate()
+    key = f'sales:best:{days}:{limit}:{today}:{watermark_key(stamp)}'
+    ranking = cache.get(key)
+    if ranking is None:
+        since = today - datetime.timedelta(days=days - 1)
+        ranking = list(
+            ProductSalesDaily.objects.filter(date__gte=since)
+            .values('product_id').annotate(units=Sum('quantity'))
+            .filter(units__gt=0).order_by('-units', 'product_id')
+            .values_list('product_id', 'units')[:limit]
+        )
+        settled = stamp is None or timezone.now() - stamp >= SETTLE
+        cache.set(key, ranking, CACHE_TTL if settled else SETTLE.seconds)
+    return ranking
+
+
+def best_sellers(days=30, limit=8):
+    """Products of the trailing window in rank order, each with .units_sold"""
+    ranking = best_seller_ids(days, limit)
+    products = Product.objects.in_bulk([pid for pid, _ in ranking])
+    result = []
+    for pid, units in ranking:
+        if pid in products:
+            products[pid].units_sold = units
+            result.append(products[pid])
+    return result
+
+
+@transaction.atomic
+def backfill(since=None):
+    """Rebuild the rollup from OrderItem (from ``since`` onwards, or everything)"""
+    rows = ProductSalesDaily.objects.all()
+    items = OrderItem.objects.exclude(order__status='cancelled')
+    if since:
+        rows = rows.filter(date__gte=since)
+        items = items.filter(order__created_at__gte=datetime.datetime.combine(
+            since, datetime.time(), tzinfo=timezone.get_current_timezone()))
+    rows.delete()
+
+    grouped = (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('product_id', 'day')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('quantity') * F('price')))
+        .order_by()
+    )
+    created = 0
+    batch = []
+    for row in grouped.iterator(chunk_size=5000):
+        batch.append(ProductSalesDaily(
+            product_id=row['product_id'], date=row['day'],
+            quantity=row['units'], revenue=row['revenue'],
+        ))
+        if len(batch) >= 5000:
+            created += len(ProductSalesDaily.objects.bulk_create(batch))
+            batch = []
+    created += len(ProductSalesDaily.objects.bulk_create(batch))
+    return created
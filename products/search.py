@@ -0,0 +1,66 @@
+"""
+Product search: PostgreSQL full-text search on a stored, GIN-indexed
+tsvector combined with pg_trgm similarity on the name for typo tolerance,
+plus per-menu facet counts for the matched set.
+"""
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import Count, F, Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Product
+
+SEARCH_CONFIG = 'english'
+SEARCH_VECTOR = (
+    SearchVector('name', weight='A', config=SEARCH_CONFIG)
+    + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+)
+MAX_RESULTS = 100
+
+
+def update_search_vectors(queryset):
+    """Recompute the stored vector for every product in ``queryset`` (one UPDATE)"""
+    if connection.vendor == 'postgresql':
+        return queryset.update(search_vector=SEARCH_VECTOR)
+    return 0
+
+
+@receiver(post_save, sender=Product)
+def update_search_vector(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'name', 'description'} & set(update_fields):
+        return
+    update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+def search_products(q, menu_ids=None, limit=20):
+    """
+    Return (products, facets) for the query ``q``. Products are ranked by
+    full-text rank plus name similarity; facets are [{'menu_id',
+    'menu__name', 'count'}] over all matches, before the menu filter.
+    """
+    q = q.strip()
+    if connection.vendor != 'postgresql':
+        # dev databases without tsvector/pg_trgm: plain substring match
+        matched = Product.objects.filter(Q(name__icontains=q) | Q(description__icontains=q))
+        ranked = matched
+        order = ['id']
+    else:
+        query = SearchQuery(q, search_type='websearch', config=SEARCH_CONFIG)
+        matched = Product.objects.filter(Q(search_vector=query) | Q(name__trigram_similar=q))
+        ranked = matched.annotate(
+            rank=SearchRank(F('search_vector'), query) + TrigramSimilarity('name', q)
+        )
+        order = ['-rank', 'id']
+
+    facets = list(
+        matched.values('menu_id', 'menu__name').annotate(count=Count('id')).order_by('-count', 'menu_id')
+    )
+    if menu_ids is not None:
+        ranked = ranked.filter(menu_id__in=menu_ids)
+    products = list(ranked.select_related('menu').order_by(*order)[:min(limit, MAX_RESULTS)])
+    return products, facets
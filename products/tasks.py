@@ -0,0 +1,201 @@
+"""
+Background tasks, stored in the Task table and run by manage.py run_workers.
+
+enqueue() defers the INSERT to transaction.on_commit, so work queued by a
+request that rolls back never runs, and a worker never picks up a task for
+an order it can't see yet. Workers claim due tasks with
+FOR UPDATE SKIP LOCKED, so any number of them can poll the same table
+without waiting on each other or claiming the same row. A claim is a lease
+(TASK_LEASE_SECONDS): a task whose worker died is claimed again once the
+lease runs out.
+
+Each task runs in one transaction together with marking it done, so the
+database side of a task (e.g. the sales rollup) happens exactly once. Work
+outside the database (email) is at-least-once. Failures are retried with
+exponential backoff until max_attempts, then left as 'failed'.
+"""
+import logging
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.mail import mail_admins, send_mail
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Order, Product, Task
+from .sales import record_order, record_orders
+
+logger = logging.getLogger('products.tasks')
+
+REGISTRY = {}
+
+
+def task(name=None, max_attempts=5):
+    """Register a function as a task; its keyword arguments must be JSON serialisable"""
+    def register(func):
+        func.task_name = name or func.__name__
+        func.max_attempts = max_attempts
+        REGISTRY[func.task_name] = func
+        return func
+    return register
+
+
+def enqueue_many(calls):
+    """Queue [(task function or name, kwargs)] in one INSERT once the current transaction commits"""
+    rows = []
+    for func, kwargs in calls:
+        name = getattr(func, 'task_name', func)
+        rows.append(Task(name=name, kwargs=kwargs, max_attempts=REGISTRY[name].max_attempts))
+    transaction.on_commit(lambda: Task.objects.bulk_create(rows))
+
+
+def enqueue(func, **kwargs):
+    enqueue_many([(func, kwargs)])
+
+
+# --- Workers ---
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _claim_sql():
+    table = connection.ops.quote_name(Task._meta.db_table)
+    return (
+        f"UPDATE {table} SET status = 'running', locked_by = %s, locked_at = now(), attempts = attempts + 1 "
+        f"WHERE id IN ("
+        f"SELECT id FROM {table} "
+        f"WHERE status IN ('queued', 'running') AND run_at <= now() "
+        f"AND (status = 'queued' OR locked_at < now() - make_interval(secs => %s)) "
+        f"ORDER BY run_at, id LIMIT %s FOR UPDATE SKIP LOCKED"
+        f") RETURNING *"
+    )
+
+
+def claim(worker, limit=10):
+    """Lease up to ``limit`` due tasks to ``worker``, oldest first"""
+    tasks = list(Task.objects.raw(_claim_sql(), [worker, settings.TASK_LEASE_SECONDS, limit]))
+    return sorted(tasks, key=lambda t: (t.run_at, t.id))
+
+
+def backoff(attempts):
+    """Seconds before retry number ``attempts``: doubling from TASK_RETRY_DELAY, capped, with jitter"""
+    delay = min(settings.TASK_RETRY_DELAY * 2 ** (attempts - 1), settings.TASK_RETRY_MAX_DELAY)
+    return delay * random.uniform(0.75, 1.25)
+
+
+def run(task_row, worker):
+    """Run one claimed task; returns True if it succeeded"""
+    # every update is conditional on still holding the lease: if it ran out and
+    # another worker took the task over, this run's outcome is discarded
+    leased = Task.objects.filter(id=task_row.id, status='running', locked_by=worker)
+    try:
+        func = REGISTRY.get(task_row.name)
+        if func is None:
+            raise LookupError(f'Unknown task {task_row.name!r}')
+        with transaction.atomic():
+            func(**task_row.kwargs)
+            if not leased.update(status='done', finished_at=timezone.now(), last_error=''):
+                raise RuntimeError('Lease lost before the task finished')
+        return True
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Task %s #%s failed (attempt %s of %s)', task_row.name, task_row.id,
+                       task_row.attempts, task_row.max_attempts, exc_info=True)
+        if task_row.attempts >= task_row.max_attempts:
+            leased.update(status='failed', finished_at=timezone.now(), last_error=error)
+        else:
+            leased.update(status='queued', locked_by='', locked_at=None, last_error=error,
+                          run_at=timezone.now() + timedelta(seconds=backoff(task_row.attempts)))
+        return False
+
+
+def run_due(worker, limit=10):
+    """Claim and run one batch; returns how many tasks were claimed"""
+    claimed = claim(worker, limit)
+    for task_row in claimed:
+        run(task_row, worker)
+    return len(claimed)
+
+
+def prune(days):
+    """Delete tasks that finished successfully more than ``days`` ago"""
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = Task.objects.filter(status='done', finished_at__lt=cutoff).delete()
+    return deleted
+
+
+# --- Order side effects ---
+def after_order(order, product_ids):
+    """Queue the follow-up work for a newly placed order (call inside its transaction)"""
+    enqueue_many([
+        (record_order_sales, {'order_id': order.id}),
+        (check_low_stock, {'product_ids': sorted(product_ids)}),
+        (send_order_confirmation, {'order_id': order.id}),
+        (render_invoice, {'order_id': order.id}),
+    ])
+
+
+@task()
+def record_order_sales(order_id, sign=1):
+    order = Order.objects.filter(id=order_id).first()
+    if order is not None:
+        record_order(order, sign)
+
+
+@task()
+def record_orders_sales(order_ids, sign=1):
+    record_orders(order_ids, sign)
+
+
+@task()
+def check_low_stock(product_ids):
+    low = list(
+        Product.objects.filter(id__in=product_ids, stock__lte=settings.LOW_STOCK_THRESHOLD)
+        .order_by('stock', 'id').values_list('id', 'name', 'stock')
+    )
+    if not low:
+        return
+    lines = [f'#{pid} {name}: {stock} left' for pid, name, stock in low]
+    logger.warning('Low stock: %s', '; '.join(lines))
+    mail_admins(f'Low stock on {len(low)} product(s)', '\n'.join(lines))
+
+
+@task()
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').filter(id=order_id).first()
+    if order is None or not order.user.email:
+        return
+    items = order.items.select_related('product')
+    body = render_to_string('orders/email/confirmation.txt', {'order': order, 'items': items})
+    send_mail(f'Order #{order.id} confirmed', body, None, [order.user.email])
+
+
+# invoices hold names and addresses, so they live outside MEDIA_ROOT (which is served publicly)
+invoice_storage = FileSystemStorage(location=settings.INVOICE_ROOT)
+
+
+def invoice_name(order_id):
+    return f'order-{order_id}.html'
+
+
+@task()
+def render_invoice(order_id):
+    order = Order.objects.select_related('user').filter(id=order_id).first()
+    if order is None:
+        return
+    html = render_to_string('orders/invoice.html', {
+        'order': order,
+        'items': order.items.select_related('product'),
+        'shipping': getattr(order, 'shipping', None),
+    })
+    name = invoice_name(order_id)
+    if invoice_storage.exists(name):  # a re-render (retry, or after a status change) replaces it
+        invoice_storage.delete(name)
+    invoice_storage.save(name, ContentFile(html.encode()))
@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from products.images import DEFAULT_SIZES, responsive
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, alt='', sizes=DEFAULT_SIZES, fallback='', **attrs):
+    """
+    <picture> with WebP and JPEG srcsets for an ImageField value (or storage name).
+    {% picture p.image alt=p.name class="card-img-top" style="height:200px" %}
+    Renders ``fallback`` (a URL) as a plain <img> when there is no usable image.
+    """
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    info = responsive(image) if image else None
+    if info is None:
+        if not fallback:
+            return ''
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', fallback, alt, extra)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="lazy" decoding="async"{}>'
+        '</picture>',
+        info.srcset('webp'), sizes, info.src, info.srcset('jpeg'), sizes, info.width, info.height, alt, extra,
+    )
+
+
+@register.simple_tag
+def srcset(image, fmt='webp'):
+    """Just the srcset attribute value, for hand-written markup"""
+    info = responsive(image) if image else None
+    return info.srcset(fmt) if info else ''
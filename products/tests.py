@@ -1,3 +1,575 @@
-from django.test import TestCase
+import gzip
+import io
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from sakthi.metrics import Registry, RequestStats
+
+from .cart import MAX_QUANTITY, add_items, apply_operations
+from .checkout import OutOfStock, place_order
+from .conditional import SETTLE
+from .export import accepts_gzip, parse_since
+from .fulfilment import transition
+from .importer import ProductImporter, read_rows
+from .models import (
+    Cart, CartItem, IdempotencyKey, Menu, MenuClosure, Order, OrderItem, Product, Shipping, StockReservation, Task,
+)
+from .pagination import SORT_KEYS, keyset_page
+from .reservations import InsufficientStock, hold, release, sweep, user_holder
+from .tasks import claim, enqueue, run, run_due, task
+
+
+def make_product(name='p', price='10.00', stock=5, **kwargs):
+    return Product.objects.create(name=name, price=Decimal(price), stock=stock, **kwargs)
+
+
+def fill_cart(user, quantities, held=True):
+    """Saved cart with {product: quantity}, held for the user the way the cart API does it"""
+    cart, _ = Cart.objects.get_or_create(user=user)
+    for product, quantity in quantities.items():
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        if held:
+            hold(user_holder(user), product.id, quantity)
+    return cart
+
+
+def settled(*querysets):
+    """Backdate updated_at past SETTLE, so the rows give an ETag"""
+    for queryset in querysets:
+        queryset.update(updated_at=timezone.now() - SETTLE * 2)
+
+
+# --- Checkout ---
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+
+    def test_places_order_and_takes_stock(self):
+        a, b = make_product('a', stock=5), make_product('b', price='2.50', stock=3)
+        fill_cart(self.user, {a: 2, b: 3})
+
+        order = place_order(self.user)
+
+        self.assertEqual(order.total_amount, Decimal('27.50'))
+        self.assertEqual(
+            sorted(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity')),
+            [(a.id, 2), (b.id, 3)],
+        )
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock, a.reserved, b.stock, b.reserved), (3, 0, 0, 0))
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_out_of_stock_rolls_back_everything(self):
+        a, b = make_product('a', stock=5), make_product('b', stock=1)
+        fill_cart(self.user, {a: 2}, held=True)
+        fill_cart(self.user, {b: 3}, held=False)
+
+        with self.assertRaises(OutOfStock) as raised:
+            place_order(self.user)
+
+        self.assertEqual(raised.exception.lines, [{'product_id': b.id, 'name': 'b', 'requested': 3, 'available': 1}])
+        self.assertFalse(Order.objects.exists())
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock, a.reserved, b.stock, b.reserved), (5, 2, 1, 0))
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 2)
+        self.assertEqual(StockReservation.objects.get(product=a).quantity, 2)
+
+    def test_units_held_by_others_are_not_for_sale(self):
+        product = make_product(stock=2)
+        hold('session:someone-else', product.id, 2)
+        fill_cart(self.user, {product: 1}, held=False)
+
+        with self.assertRaises(OutOfStock) as raised:
+            place_order(self.user)
+        self.assertEqual(raised.exception.lines[0]['available'], 0)
+
+
+# --- Stock holds ---
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.product = make_product(stock=5)
+
+    def reserved(self):
+        self.product.refresh_from_db()
+        return self.product.reserved
+
+    def test_hold_replaces_earlier_hold(self):
+        hold('user:1', self.product.id, 3)
+        hold('user:1', self.product.id, 1)
+        self.assertEqual(self.reserved(), 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+    def test_hold_beyond_stock_keeps_earlier_hold(self):
+        hold('user:1', self.product.id, 2)
+        hold('user:2', self.product.id, 2)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            hold('user:1', self.product.id, 4)
+
+        self.assertEqual(raised.exception.line, {'product_id': self.product.id, 'requested': 4, 'available': 3})
+        self.assertEqual(self.reserved(), 4)
+        self.assertEqual(StockReservation.objects.get(holder='user:1').quantity, 2)
+
+    def test_release(self):
+        other = make_product('other', stock=5)
+        hold('user:1', self.product.id, 2)
+        hold('user:1', other.id, 1)
+        hold('user:2', self.product.id, 1)
+
+        self.assertEqual(release('user:1', [self.product.id]), 1)
+        self.assertEqual(self.reserved(), 1)
+        self.assertEqual(release('user:1'), 1)
+        other.refresh_from_db()
+        self.assertEqual(other.reserved, 0)
+        self.assertEqual(list(StockReservation.objects.values_list('holder', flat=True)), ['user:2'])
+
+    def test_sweep_releases_only_expired_holds(self):
+        for n in range(1, 4):
+            hold(f'user:{n}', self.product.id, 1)
+        StockReservation.objects.exclude(holder='user:3').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(sweep(batch_size=1), 2)
+        self.assertEqual(self.reserved(), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('holder', flat=True)), ['user:3'])
+
+
+class ConcurrentHoldTests(TransactionTestCase):
+    def test_last_unit_goes_to_one_holder(self):
+        product = make_product(stock=1)
+        barrier = threading.Barrier(4)
+        outcomes = []
+
+        def shopper(n):
+            barrier.wait()
+            try:
+                hold(f'user:{n}', product.id, 1)
+                outcomes.append('held')
+            except InsufficientStock:
+                outcomes.append('refused')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=shopper, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['held', 'refused', 'refused', 'refused'])
+        product.refresh_from_db()
+        self.assertEqual(product.reserved, 1)
+        self.assertEqual(StockReservation.objects.filter(quantity__gt=0).count(), 1)
+
+
+# --- Idempotency keys ---
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.product = make_product(stock=5)
+        fill_cart(self.user, {self.product: 2})
+
+    def post(self, key, data=None):
+        return self.client.post('/api/orders/', data or {}, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post('retry-1')
+        second = self.post('retry-1')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_key_reused_for_a_different_request(self):
+        self.assertEqual(self.post('reused').status_code, 200)
+        response = self.post('reused', {'note': 'something else'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_client_error_is_replayed(self):
+        CartItem.objects.all().delete()
+        self.assertEqual(self.post('empty').status_code, 400)
+        fill_cart(self.user, {self.product: 1}, held=False)
+
+        # unlike a 5xx, a 4xx is stored: the same key keeps getting it
+        self.assertEqual(self.post('empty').status_code, 400)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 400)
+        self.assertEqual(self.post('fresh').status_code, 200)
+
+
+# --- Fulfilment ---
+class FulfilmentTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.product = make_product(stock=10)
+
+    def order(self, status, quantity=2, shipping=False):
+        order = Order.objects.create(user=self.user, status=status, total_amount=Decimal('20.00'))
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=Decimal('10.00'))
+        if shipping:
+            Shipping.objects.create(
+                order=order, full_name='A', address_line1='1 Road', city='C', state='S',
+                postal_code='1', country='IN', phone='1',
+            )
+        return order
+
+    def test_ship_skips_orders_that_cannot_move(self):
+        ready = self.order('processing', shipping=True)
+        no_address = self.order('processing')
+        pending = self.order('pending', shipping=True)
+
+        result = transition([ready.id, no_address.id, pending.id, 999999], 'shipped')
+
+        self.assertEqual(result.changed, [ready.id])
+        self.assertEqual(result.skipped, {no_address.id: 'processing', pending.id: 'pending', 999999: None})
+        ready.refresh_from_db()
+        self.assertEqual(ready.status, 'shipped')
+        self.assertIsNotNone(Shipping.objects.get(order=ready).shipped_at)
+        self.assertEqual(Order.objects.get(id=pending.id).status, 'pending')
+
+    def test_cancel_restocks_once(self):
+        first, second = self.order('pending', 2), self.order('processing', 3)
+        shipped = self.order('shipped', 4)
+
+        result = transition([first.id, second.id, shipped.id], 'cancelled')
+
+        self.assertEqual(result.changed, [first.id, second.id])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 15)
+
+        # already cancelled: skipped, not restocked again
+        again = transition([first.id], 'cancelled')
+        self.assertEqual((again.changed, again.skipped), ([], {first.id: 'cancelled'}))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 15)
+
+
+# --- Keyset pagination ---
+class KeysetPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # repeated prices, names and ratings so every sort has ties for the id tiebreak
+        Product.objects.bulk_create([
+            Product(name=f'n{n % 4}', price=Decimal(n % 3), stock=1, rating_avg=float(n % 5) / 2)
+            for n in range(17)
+        ])
+
+    def test_cursor_round_trip_on_every_sort(self):
+        for sort, (field, descending) in SORT_KEYS.items():
+            with self.subTest(sort=sort):
+                order = [f'-{field}', '-id'] if descending else [field, 'id']
+                expected = list(Product.objects.order_by(*order).values_list('id', flat=True))
+                seen, cursor = [], None
+                while True:
+                    rows, cursor = keyset_page(Product.objects.all(), ['id', 'name'], sort=sort, cursor=cursor, limit=4)
+                    self.assertTrue(all(list(row) == ['id', 'name'] for row in rows))
+                    seen.extend(row['id'] for row in rows)
+                    if cursor is None:
+                        break
+                self.assertEqual(seen, expected)
+
+    def test_api_pages_follow_cursor(self):
+        client = APIClient()
+        seen, cursor = [], ''
+        while True:
+            response = client.get('/api/products/', {'sort': '-price', 'limit': 5, 'fields': 'id', 'cursor': cursor})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend(row['id'] for row in body['results'])
+            cursor = body['next']
+            if not cursor:
+                break
+        self.assertEqual(seen, list(Product.objects.order_by('-price', '-id').values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = APIClient().get('/api/products/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+# --- Menu closure table ---
+class MenuClosureTests(TestCase):
+    def setUp(self):
+        self.top = Menu.objects.create(name='top')
+        self.middle = Menu.objects.create(name='middle', parent=self.top)
+        self.leaf = Menu.objects.create(name='leaf', parent=self.middle)
+
+    def subtree(self, menu):
+        return set(Menu.objects.filter(id__in=Menu.subtree_ids(menu.id)).values_list('name', flat=True))
+
+    def test_refuses_cycles(self):
+        pairs = set(MenuClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        for parent in (self.leaf, self.middle):
+            top = Menu.objects.get(id=self.top.id)
+            top.parent = parent
+            with self.subTest(parent=parent.name):
+                with self.assertRaises(ValidationError):
+                    top.full_clean()
+                with self.assertRaises(ValueError):
+                    top.save()
+        self.assertIsNone(Menu.objects.get(id=self.top.id).parent_id)
+        self.assertEqual(set(MenuClosure.objects.values_list('ancestor_id', 'descendant_id', 'depth')), pairs)
+
+    def test_move_rehangs_subtree(self):
+        other = Menu.objects.create(name='other')
+        middle = Menu.objects.get(id=self.middle.id)
+        middle.parent = other
+        middle.save()
+
+        self.assertEqual(self.subtree(self.top), {'top'})
+        self.assertEqual(self.subtree(other), {'other', 'middle', 'leaf'})
+        self.assertEqual(MenuClosure.objects.get(ancestor=other, descendant=self.leaf).depth, 2)
+
+
+# --- Conditional GET ---
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        settled(Product.objects.all())
+        self.client = APIClient()
+
+    def test_not_modified_until_a_write(self):
+        first = self.client.get('/api/products/')
+        etag = first['ETag']
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Product.objects.filter(id=self.product.id).update(name='renamed', updated_at=timezone.now())
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))  # not settled yet
+
+        settled(Product.objects.all())
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_delete_changes_etag(self):
+        make_product(name='other')
+        settled(Product.objects.all())
+        etag = self.client.get('/api/products/')['ETag']
+
+        Product.objects.filter(id=self.product.id).delete()
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+# --- Bulk import ---
+class ImporterTests(TestCase):
+    def run_csv(self, text, **kwargs):
+        return ProductImporter(**kwargs).run(read_rows(io.StringIO(text), 'csv'))
+
+    def test_repeated_sku_last_row_wins_and_earlier_is_reported(self):
+        result = self.run_csv('sku,name,price\nA,first,1\nB,bee,2\nA,second,3\n')
+
+        self.assertEqual((result.rows, result.written), (3, 2))
+        self.assertEqual(result.errors, [(2, "sku 'A' repeated on line 4")])
+        self.assertEqual(Product.objects.get(sku='A').name, 'second')
+
+    def test_repeated_sku_across_chunks(self):
+        result = self.run_csv('sku,name,price\nA,first,1\nA,second,3\n', chunk_size=1)
+
+        self.assertEqual((result.written, result.errors), (2, []))
+        self.assertEqual(Product.objects.get(sku='A').name, 'second')
+
+    def test_missing_columns_keep_current_values(self):
+        make_product(sku='A', stock=7, description='keep')
+        result = self.run_csv('sku,name,price\nA,renamed,2\nB,,1\n')
+
+        self.assertEqual(result.errors, [(3, 'name required')])
+        product = Product.objects.get(sku='A')
+        self.assertEqual((product.name, product.price, product.stock, product.description),
+                         ('renamed', Decimal('2.00'), 7, 'keep'))
+
+    def test_api_refuses_non_utf8_before_writing(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        upload = SimpleUploadedFile('p.csv', b'sku,name,price\nA,ok,1\nB,caf\xe9,1\n')
+
+        response = client.post('/api/products/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Product.objects.exists())
+
+    def test_command_refuses_non_utf8_before_writing(self):
+        data = b'sku,name,price\nA,ok,1\nB,caf\xe9,1\n'
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            f.write(data)
+            f.flush()
+            with self.assertRaises(CommandError):
+                call_command('import_products', f.name, chunk_size=1, stdout=io.StringIO())
+        stdin = io.TextIOWrapper(io.BytesIO(data))
+        with mock.patch('sys.stdin', stdin), self.assertRaises(CommandError):
+            call_command('import_products', '-', format='csv', chunk_size=1, stdout=io.StringIO())
+        self.assertFalse(Product.objects.exists())
+
+
+# --- Background tasks ---
+calls = []
+
+
+@task(name='tests.record', max_attempts=2)
+def record_call(value, fail=False):
+    calls.append(value)
+    if fail:
+        raise RuntimeError('failed on purpose')
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def queue(self, **kwargs):
+        # the claim compares with the database's now(), which is the start of the test's transaction
+        return Task.objects.create(name='tests.record', kwargs=kwargs, max_attempts=2,
+                                   run_at=timezone.now() - timedelta(days=1))
+
+    def test_enqueue_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue(record_call, value=1)
+            self.assertFalse(Task.objects.exists())
+        self.assertEqual(list(Task.objects.values_list('name', 'kwargs')), [('tests.record', {'value': 1})])
+
+    def test_claimed_task_is_leased(self):
+        queued = self.queue(value=1)
+        self.assertEqual([t.id for t in claim('w1')], [queued.id])
+        self.assertEqual(claim('w2'), [])
+
+        # the lease runs out: another worker takes the task over and the first one's run is discarded
+        Task.objects.filter(id=queued.id).update(locked_at=timezone.now() - timedelta(days=1))
+        taken, = claim('w2')
+        with self.assertLogs('products.tasks', 'WARNING'):
+            self.assertFalse(run(Task.objects.get(id=queued.id), 'w1'))
+        self.assertEqual(Task.objects.get(id=queued.id).locked_by, 'w2')
+        self.assertTrue(run(taken, 'w2'))
+        self.assertEqual(Task.objects.get(id=queued.id).status, 'done')
+
+    def test_failure_backs_off_then_gives_up(self):
+        queued = self.queue(value=1, fail=True)
+        with self.assertLogs('products.tasks', 'WARNING'):
+            self.assertEqual(run_due('w1'), 1)
+
+        retry = Task.objects.get(id=queued.id)
+        self.assertEqual((retry.status, retry.attempts, retry.locked_by), ('queued', 1, ''))
+        self.assertGreater(retry.run_at, timezone.now())
+        self.assertIn('failed on purpose', retry.last_error)
+        self.assertEqual(run_due('w1'), 0)  # not due yet
+
+        Task.objects.filter(id=queued.id).update(run_at=timezone.now() - timedelta(days=1))
+        with self.assertLogs('products.tasks', 'WARNING'):
+            self.assertEqual(run_due('w1'), 1)
+        self.assertEqual(Task.objects.get(id=queued.id).status, 'failed')
+        self.assertEqual(calls, [1, 1])
+
+
+# --- Export ---
+class ExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('reader'))
+
+    def test_parse_since(self):
+        self.assertEqual(parse_since('2024-05-01'), timezone.make_aware(datetime(2024, 5, 1)))
+        self.assertEqual(parse_since('2024-05-01T10:00:00 02:00'), parse_since('2024-05-01T08:00:00Z'))
+        self.assertIsNone(parse_since('yesterday'))
+
+    def test_accepts_gzip(self):
+        for header, expected in (('gzip', True), ('br, gzip;q=0.5', True), ('gzip;q=0', False),
+                                 ('deflate, *', True), ('gzip;q=0, *', False), ('identity', False), ('', False)):
+            with self.subTest(header=header):
+                self.assertEqual(accepts_gzip(header), expected)
+
+    def test_export_since_and_encoding(self):
+        old = make_product(name='old')
+        Product.objects.filter(id=old.id).update(updated_at=timezone.now() - timedelta(days=2))
+        make_product(name='new')
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+
+        response = self.client.get('/api/products/export/', {'output': 'csv', 'since': since},
+                                   HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('new', body)
+        self.assertNotIn('old', body)
+
+        response = self.client.get('/api/products/export/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn('old', body)
+        self.assertIn('new', body)
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get('/api/products/export/', {'since': 'soon'}).status_code, 400)
+
+
+# --- Cart batch ---
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.a, self.b, self.c = (make_product(name=name, stock=50) for name in 'abc')
+
+    def post(self, operations):
+        return self.client.post('/api/cart/batch/', {'operations': operations}, format='json')
+
+    def quantities(self):
+        return dict(CartItem.objects.values_list('product_id', 'quantity'))
+
+    def test_operations_coalesce_in_order(self):
+        fill_cart(self.user, {self.c: 1})
+        response = self.post([
+            {'op': 'add', 'product_id': self.a.id, 'quantity': 2},
+            {'op': 'add', 'product_id': self.a.id},
+            {'op': 'set', 'product_id': self.b.id, 'quantity': 4},
+            {'op': 'remove', 'product_id': self.c.id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.quantities(), {self.a.id: 3, self.b.id: 4})
+
+    def test_unknown_product_changes_nothing(self):
+        response = self.post([{'op': 'add', 'product_id': self.a.id}, {'op': 'add', 'product_id': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quantities(), {})
+
+    def test_add_caps_quantity_and_stamps_cart_only_on_change(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.a, quantity=MAX_QUANTITY - 1)
+        settled(Cart.objects.all())
+        stamp = Cart.objects.get().updated_at
+
+        apply_operations(cart.id, [{'op': 'remove', 'product_id': self.b.id}])
+        self.assertEqual(Cart.objects.get().updated_at, stamp)
+
+        add_items(cart.id, {self.a.id: 5, self.b.id: 2})
+        self.assertEqual(self.quantities(), {self.a.id: MAX_QUANTITY, self.b.id: 2})
+        self.assertGreater(Cart.objects.get().updated_at, stamp)
+
+
+# --- Metrics ---
+class MetricsTests(TestCase):
+    def test_label_values_are_escaped(self):
+        registry = Registry()
+        registry.observe('/odd"route\\\n', 'GET', 200, 0.01, RequestStats(), 10, False)
+        text = registry.render()
+        self.assertIn('sakthi_requests_total{route="/odd\\"route\\\\\\n",method="GET",status="200"} 1', text)
+        self.assertEqual(len([line for line in text.splitlines() if line.startswith('sakthi_requests_total')]), 1)
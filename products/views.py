@@ -1,33 +1,56 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.views import View
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
+from django.http import FileResponse
 from .models import (
-    Product, Cart, CartItem, Favourite,
-    Review, Order, OrderItem, Shipping, Payment, Menu
+    Product, Favourite,
+    Order, OrderItem, Shipping, Payment, Menu
 )
+from . import cache as catalogue_cache
+from .cart import SessionCart
+from .facets import FilterState, facet_counts, facet_options, filter_products
+from .checkout import CartEmpty, OutOfStock, place_order
+from .orders import history_page
+from .pagination import InvalidCursor
+from .related import fallback_queryset, related_queryset
+from .reservations import InsufficientStock, renew
+from .search import search_products
+from .tasks import invoice_name, invoice_storage
 from django.db import transaction
 
+REVIEWS_ON_DETAIL = 20
+RELATED_ON_DETAIL = 8
+
 # --- PRODUCTS ---
+async def _alist(queryset):
+    return [obj async for obj in queryset.aiterator()]
+
+
 class ProductListView(View):
     template_name = "products_list.html"
 
-    def get(self, request):
-        menu_id = request.GET.get("category")  # category id from ?category=1
-        products = Product.objects.all()
-
-        if menu_id:
-            products = products.filter(menu_id=menu_id)  # filter by menu/category
+    async def get(self, request):
+        # ?category=<menu id, includes submenus>&price=<range>&in_stock=1&rating=<min>
+        state = FilterState.from_query(request.GET)
+        products = filter_products(Product.objects.all(), state)
 
-        menus = Menu.objects.filter(parent__isnull=True).prefetch_related("children")
+        # independent reads, awaited together
+        menus, products, counts, request.user = await asyncio.gather(
+            catalogue_cache.amenu_tree(), _alist(products), sync_to_async(facet_counts)(state), request.auser(),
+        )
 
         return render(request, self.template_name, {
             "products": products,
             "menus": menus,
-            "selected_menu": menu_id,
+            "facets": facet_options(state, counts, menus),
+            "filters": state,
         })
 
-    def post(self, request):
+    async def post(self, request):
         name = request.POST.get('name')
         price = request.POST.get('price')
         stock = request.POST.get('stock', 0)
@@ -38,7 +61,7 @@ class ProductListView(View):
             messages.error(request, "Name and price required")
             return redirect('products')
 
-        Product.objects.create(
+        await Product.objects.acreate(
             name=name,
             price=price,
             stock=stock,
@@ -50,20 +73,49 @@ class ProductListView(View):
 
 
 
+class ProductSearchView(View):
+    template_name = "search.html"
+
+    def get(self, request):
+        q = request.GET.get("q", "").strip()
+        menu_id = request.GET.get("category")
+        products, facets = [], []
+        if q:
+            menu_ids = Menu.subtree_ids(int(menu_id)) if menu_id and menu_id.isdigit() else None
+            products, facets = search_products(q, menu_ids, limit=48)
+
+        return render(request, self.template_name, {
+            "q": q,
+            "products": products,
+            "facets": facets,
+            "selected_menu": menu_id,
+        })
+
+
 class ProductDetailView(View):
     template_name = "product_detail.html"
 
-    def get(self, request, pk):
-        product = get_object_or_404(Product, pk=pk)
+    async def get(self, request, pk):
+        product = await aget_object_or_404(Product.objects.select_related('menu'), pk=pk)
 
         # Quantity default
         quantity = int(request.GET.get("quantity", 1))
 
-        # Related products: same menu or category, exclude current product
-        related_products = Product.objects.filter(menu=product.menu).exclude(id=product.id)[:8]
+        # Related products: precomputed co-occurrence (products.related)
+        related_products = related_queryset(product.id)[:RELATED_ON_DETAIL]
 
-        # Reviews for this product
-        reviews = product.reviews.select_related('user').order_by('-created_at')
+        # Latest reviews for this product; totals come from the denormalised rating fields
+        reviews = product.reviews.select_related('user').order_by('-created_at')[:REVIEWS_ON_DETAIL]
+
+        related_products, reviews, request.user = await asyncio.gather(
+            _alist(related_products), _alist(reviews), request.auser(),
+        )
+        if len(related_products) < RELATED_ON_DETAIL:
+            # not enough history for this product yet: top up from its menu
+            related_products += await _alist(
+                fallback_queryset(product, [p.id for p in related_products])
+                [:RELATED_ON_DETAIL - len(related_products)]
+            )
 
         context = {
             "product": product,
@@ -74,32 +126,50 @@ class ProductDetailView(View):
         return render(request, self.template_name, context)
 
 # --- CART ---
-class CartView(LoginRequiredMixin, View):
+class CartView(View):
     template_name = "cart.html"
-    login_url = "login"
 
     def get(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        items = CartItem.objects.filter(cart=cart).select_related('product')
-        total = sum(item.product.price * item.quantity for item in items)
+        cart = SessionCart(request)
+        items = cart.lines()
+        if items:
+            renew(cart.holder)  # on the way to checkout: keep the stock held a while longer
+        total = sum(item.subtotal for item in items)
         return render(request, self.template_name, {"cart": cart, "items": items, "total": total})
 
     def post(self, request):
         product_id = request.POST.get('product_id')
         quantity = int(request.POST.get('quantity', 1))
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        product = get_object_or_404(Product, id=product_id)
-        item, created = CartItem.objects.get_or_create(
-            cart=cart, product=product,
-            defaults={'quantity': quantity}
-        )
-        if not created:
-            item.quantity += quantity
-            item.save()
+        product = get_object_or_404(Product.objects.only('id', 'name'), id=product_id)
+        try:
+            SessionCart(request).add(product.id, quantity)
+        except InsufficientStock as e:
+            messages.error(request, f"Only {e.line['available']} of {product.name} available")
+            return redirect('cart')
         messages.success(request, "Added to cart")
         return redirect('cart')
 
 
+class CheckoutView(LoginRequiredMixin, View):
+    login_url = 'login'
+
+    def post(self, request):
+        cart = SessionCart(request)
+        cart.persist()
+        try:
+            order = place_order(request.user)
+        except CartEmpty:
+            messages.warning(request, "Your cart is empty")
+            return redirect('cart')
+        except OutOfStock as e:
+            for line in e.lines:
+                messages.error(request, f"Only {line['available']} of {line['name']} left in stock")
+            return redirect('cart')
+        cart.checked_out()
+        messages.success(request, f"Order #{order.id} placed")
+        return redirect('order_detail', pk=order.id)
+
+
 # --- FAVOURITES ---
 class FavouriteView(LoginRequiredMixin, View):
     template_name = "favourites.html"
@@ -121,8 +191,15 @@ class OrderListView(LoginRequiredMixin, View):
     template_name = "orders/order_list.html"
 
     def get(self, request):
-        orders = Order.objects.filter(user=request.user).select_related('shipping', 'payment')
-        return render(request, self.template_name, {'orders': orders})
+        try:
+            summaries, next_cursor = history_page(request.user, request.GET.get('cursor'))
+        except InvalidCursor:
+            return redirect('order_list')
+        return render(request, self.template_name, {
+            'summaries': summaries,
+            'next_cursor': next_cursor,
+            'paged': bool(request.GET.get('cursor')),
+        })
 
 
 # --- Order Detail ---
@@ -130,8 +207,9 @@ class OrderDetailView(LoginRequiredMixin, View):
     template_name = "orders/order_detail.html"
 
     def get(self, request, pk):
-        order = get_object_or_404(Order, pk=pk, user=request.user)
-        items = order.items.select_related('product')
+        order = get_object_or_404(Order.objects.select_related('shipping', 'payment'), pk=pk, user=request.user)
+        items = order.items.select_related('product').only(
+            'quantity', 'price', 'product__id', 'product__name', 'product__image')
         return render(request, self.template_name, {
             'order': order,
             'items': items,
@@ -140,6 +218,21 @@ class OrderDetailView(LoginRequiredMixin, View):
         })
 
 
+# --- Invoice ---
+class OrderInvoiceView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        order = get_object_or_404(Order, pk=pk, user=request.user)
+        name = invoice_name(order.id)
+        if invoice_storage.exists(name):
+            return FileResponse(invoice_storage.open(name), content_type='text/html; charset=utf-8')
+        # not rendered by the workers yet
+        return render(request, 'orders/invoice.html', {
+            'order': order,
+            'items': order.items.select_related('product'),
+            'shipping': getattr(order, 'shipping', None),
+        })
+
+
 # --- Shipping Update ---
 class ShippingUpdateView(LoginRequiredMixin, View):
     template_name = "orders/shipping_form.html"
@@ -189,11 +282,14 @@ class PaymentUpdateView(LoginRequiredMixin, View):
 class DashboardView(View):
     template_name = "dashboard.html"
 
-    def get(self, request):
-        menus = Menu.objects.filter(parent__isnull=True).prefetch_related('children')
-        recently_added = Product.objects.order_by('-id')[:8]  # last 8 products
-        best_sellers = Product.objects.order_by('-stock')[:8]  # placeholder: you can calculate based on sales
-        reviews = Review.objects.select_related('user', 'product').order_by('-id')[:10]
+    async def get(self, request):
+        menus, recently_added, best_sellers, reviews, request.user = await asyncio.gather(
+            catalogue_cache.amenu_tree(),
+            catalogue_cache.arecent_products(8),  # last 8 products
+            catalogue_cache.abest_sellers(days=30, limit=8),  # from the daily sales rollup
+            catalogue_cache.arecent_reviews(10),
+            request.auser(),
+        )
 
         return render(request, self.template_name, {
             'menus': menus,
@@ -203,17 +299,16 @@ class DashboardView(View):
         })
         
 # Add to Cart via GET
-class AddToCartView(LoginRequiredMixin, View):
-    login_url = 'login'
+class AddToCartView(View):
 
     def get(self, request, product_id):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        product = get_object_or_404(Product, id=product_id)
-        item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': 1})
-        if not created:
-            item.quantity += 1
-            item.save()
-        messages.success(request, f"{product.name} added to cart")
+        product = get_object_or_404(Product.objects.only('id', 'name'), id=product_id)
+        try:
+            SessionCart(request).add(product.id)
+        except InsufficientStock as e:
+            messages.error(request, f"Only {e.line['available']} of {product.name} available")
+        else:
+            messages.success(request, f"{product.name} added to cart")
         return redirect(request.META.get('HTTP_REFERER', 'products'))
 
 # Add to Favourite via GET
@@ -226,13 +321,11 @@ class AddToFavouriteView(LoginRequiredMixin, View):
         messages.success(request, f"{product.name} added to favourites")
         return redirect(request.META.get('HTTP_REFERER', 'products'))
 
-class RemoveCartItemView(LoginRequiredMixin, View):
-    login_url = 'login'
+class RemoveCartItemView(View):
 
-    def get(self, request, item_id):
-        item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        item.delete()
-        messages.success(request, f"{item.product.name} removed from cart")
+    def get(self, request, product_id):
+        SessionCart(request).remove(product_id)
+        messages.success(request, "Item removed from cart")
         return redirect('cart')
     
 
@@ -245,24 +338,26 @@ class RemoveFavouriteView(LoginRequiredMixin, View):
         messages.success(request, f"Removed {fav.product.name} from favourites.")
         return redirect('favourites')
     
-class UpdateCartItemView(LoginRequiredMixin, View):
-    login_url = 'login'
+class UpdateCartItemView(View):
 
-    def get(self, request, item_id, action):
+    def get(self, request, product_id, action):
         """
         action = 'inc' or 'dec'
         """
-        cart_item = get_object_or_404(CartItem, id=item_id, cart__user=request.user)
-        
-        if action == 'inc':
-            cart_item.quantity += 1
-            cart_item.save()
-            messages.success(request, f"Quantity updated for {cart_item.product.name}")
-        elif action == 'dec' and cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-            messages.success(request, f"Quantity updated for {cart_item.product.name}")
+        cart = SessionCart(request)
+        quantity = cart.quantity(product_id)
+
+        if quantity and action == 'inc':
+            try:
+                cart.set(product_id, quantity + 1)
+            except InsufficientStock as e:
+                messages.error(request, f"Only {e.line['available']} available")
+            else:
+                messages.success(request, "Quantity updated")
+        elif action == 'dec' and quantity > 1:
+            cart.set(product_id, quantity - 1)
+            messages.success(request, "Quantity updated")
         else:
             messages.warning(request, "Minimum quantity is 1")
 
-        return redirect('cart')
\ No newline at end of file
+        return redirect('cart')
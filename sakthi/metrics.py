@@ -0,0 +1,238 @@
+"""
+Per-route request metrics: query count, DB time, template/serialiser render
+time, response size and latency, kept in process memory and exposed as
+Prometheus text at /metrics. Requests whose query count or repeated
+statements go over the configured thresholds are logged as likely N+1s.
+
+Each worker process keeps its own counters; scrape every worker (or run one
+process per container) to get the full picture.
+
+Works under WSGI and ASGI: the query counter is installed on every database
+connection and finds the current request's stats through a context variable,
+which asgiref carries into the threads the async ORM runs queries in.
+"""
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger('sakthi.metrics')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar('sakthi_request_stats', default=None)
+
+
+def _label(value):
+    """A label value as the text exposition format wants it: backslash, quote and newline escaped"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'render_seconds', 'statements')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+        self.statements = Counter()
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter()           # (route, method, status) -> n
+        self.totals = defaultdict(Counter)  # route -> {duration, db, render, queries, bytes, n_plus_one}
+        self.buckets = defaultdict(Counter)  # route -> {le: n}
+
+    def observe(self, route, method, status, duration, stats, size, flagged):
+        with self.lock:
+            self.requests[(route, method, status)] += 1
+            totals = self.totals[route]
+            totals['count'] += 1
+            totals['duration'] += duration
+            totals['db'] += stats.db_seconds
+            totals['render'] += stats.render_seconds
+            totals['queries'] += stats.queries
+            totals['bytes'] += size
+            totals['n_plus_one'] += flagged
+            buckets = self.buckets[route]
+            for le in DURATION_BUCKETS:
+                if duration <= le:
+                    buckets[le] += 1
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self.lock:
+            metric('sakthi_requests_total', 'counter', 'Requests by route, method and status.')
+            for (route, method, status), n in sorted(self.requests.items()):
+                lines.append(f'sakthi_requests_total{{route="{_label(route)}",method="{_label(method)}",'
+                             f'status="{status}"}} {n}')
+
+            metric('sakthi_request_duration_seconds', 'histogram', 'Request latency by route.')
+            for route, totals in sorted(self.totals.items()):
+                label = _label(route)
+                for le in DURATION_BUCKETS:
+                    lines.append(f'sakthi_request_duration_seconds_bucket{{route="{label}",le="{le}"}} '
+                                 f'{self.buckets[route][le]}')
+                lines.append(f'sakthi_request_duration_seconds_bucket{{route="{label}",le="+Inf"}} {totals["count"]}')
+                lines.append(f'sakthi_request_duration_seconds_sum{{route="{label}"}} {totals["duration"]:.6f}')
+                lines.append(f'sakthi_request_duration_seconds_count{{route="{label}"}} {totals["count"]}')
+
+            for name, key, kind, help_text in (
+                ('sakthi_db_queries_total', 'queries', 'counter', 'SQL statements executed.'),
+                ('sakthi_db_duration_seconds_total', 'db', 'counter', 'Time spent in the database.'),
+                ('sakthi_render_duration_seconds_total', 'render', 'counter', 'Time spent rendering templates/responses.'),
+                ('sakthi_response_bytes_total', 'bytes', 'counter', 'Response body bytes (non-streaming).'),
+                ('sakthi_n_plus_one_total', 'n_plus_one', 'counter', 'Requests over the N+1 thresholds.'),
+            ):
+                metric(name, kind, help_text)
+                for route, totals in sorted(self.totals.items()):
+                    value = totals[key]
+                    value = f'{value:.6f}' if isinstance(value, float) else value
+                    lines.append(f'{name}{{route="{_label(route)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_seconds += time.perf_counter() - started
+        stats.queries += 1
+        stats.statements[sql] += 1
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.render_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend whose templates report their render time to the metrics middleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def _route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + match.route
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.max_queries = getattr(settings, 'METRICS_MAX_QUERIES', 30)
+        self.max_repeats = getattr(settings, 'METRICS_MAX_REPEATED_QUERIES', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path == '/metrics':
+            return self.get_response(request)
+
+        install_query_counter(None, connection)  # connections opened before this module loaded
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.observe(request, response, stats, started)
+
+    async def __acall__(self, request):
+        if request.path == '/metrics':
+            return await self.get_response(request)
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.observe(request, response, stats, started)
+
+    def observe(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+
+        render_window = getattr(request, '_metrics_render_window', None)
+        if render_window:
+            # TemplateResponse/DRF Response are rendered after the view returns; the
+            # window already includes any template time recorded while rendering
+            started_render, render_before = render_window
+            stats.render_seconds = render_before + (time.perf_counter() - started_render)
+
+        route = _route(request)
+        repeated = max(stats.statements.values(), default=0)
+        flagged = stats.queries > self.max_queries or repeated > self.max_repeats
+        if flagged:
+            sql, times = stats.statements.most_common(1)[0]
+            logger.warning(
+                "%s %s ran %d queries (%.1f ms in DB); most repeated x%d: %s",
+                request.method, route, stats.queries, stats.db_seconds * 1000, times, sql[:200],
+            )
+
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(route, request.method, response.status_code, duration, stats, size, flagged)
+        return response
+
+    def process_template_response(self, request, response):
+        stats = _current.get()
+        if stats is not None:
+            request._metrics_render_window = (time.perf_counter(), stats.render_seconds)
+        return response
+
+
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
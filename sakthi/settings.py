@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # OWN APPS
     'accounts',
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sakthi.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,7 +65,7 @@ ROOT_URLCONF = 'sakthi.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'sakthi.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -108,6 +110,71 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local memory by default so it works offline. That cache is per process: the
+# version bumps of products.cache only reach the process that made them, so
+# anything running more than one process (gunicorn workers, run_workers, the
+# sweeper) needs a shared cache with an atomic incr, i.e.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://host:6379/0 (docker-compose.yaml sets them; the
+# production profile insists on it). FileBasedCache won't do: its incr is a
+# get and a set, so concurrent bumps get lost.
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'sakthi'),
+        'TIMEOUT': 300,
+    }
+}
+if CACHE_BACKEND.endswith(('LocMemCache', 'FileBasedCache')):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': 10000}  # Redis/Memcached evict on their own
+
+# Sessions carry the working cart (products.cart), so reads come from the cache;
+# SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies keeps cart
+# clicks off the database entirely.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Request metrics (sakthi.metrics), scraped from /metrics
+# requests running more queries, or repeating one statement more often, are logged as likely N+1s
+
+METRICS_MAX_QUERIES = int(os.environ.get('METRICS_MAX_QUERIES', 30))
+METRICS_MAX_REPEATED_QUERIES = int(os.environ.get('METRICS_MAX_REPEATED_QUERIES', 5))
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
+# Background tasks (products.tasks, run by manage.py run_workers)
+# a claimed task is taken over by another worker if not finished within the lease;
+# failures retry after TASK_RETRY_DELAY seconds, doubling up to TASK_RETRY_MAX_DELAY
+
+TASK_LEASE_SECONDS = int(os.environ.get('TASK_LEASE_SECONDS', 300))
+TASK_RETRY_DELAY = int(os.environ.get('TASK_RETRY_DELAY', 10))
+TASK_RETRY_MAX_DELAY = int(os.environ.get('TASK_RETRY_MAX_DELAY', 60 * 60))
+TASK_KEEP_DONE_DAYS = int(os.environ.get('TASK_KEEP_DONE_DAYS', 7))
+LOW_STOCK_THRESHOLD = int(os.environ.get('LOW_STOCK_THRESHOLD', 5))
+
+# Stock holds (products.reservations): putting a product in the cart holds it for
+# STOCK_HOLD_MINUTES; manage.py sweep_reservations gives expired holds back
+STOCK_HOLD_MINUTES = int(os.environ.get('STOCK_HOLD_MINUTES', 15))
+
+# Idempotency-Key on order/payment/shipping POSTs (products.idempotency): responses are
+# replayed for IDEMPOTENCY_KEY_HOURS; a duplicate waits up to IDEMPOTENCY_WAIT_SECONDS
+# for the first request with its key to finish
+IDEMPOTENCY_KEY_HOURS = int(os.environ.get('IDEMPOTENCY_KEY_HOURS', 24))
+IDEMPOTENCY_WAIT_SECONDS = int(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10))
+
+# Email (order confirmations, low-stock alerts to ADMINS); printed to the console unless configured
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '0') == '1'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'orders@localhost')
+SERVER_EMAIL = DEFAULT_FROM_EMAIL
+ADMINS = [('Admin', email) for email in os.environ.get('DJANGO_ADMINS', '').split(',') if email]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -150,4 +217,5 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+INVOICE_ROOT = os.environ.get('INVOICE_ROOT', os.path.join(BASE_DIR, 'private', 'invoices'))  # not served
\ No newline at end of file
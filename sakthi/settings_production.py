@@ -0,0 +1,80 @@
+"""
+Production profile: DJANGO_SETTINGS_MODULE=sakthi.settings_production
+
+Everything not set here comes from sakthi.settings. Run it with
+gunicorn -c gunicorn.conf.py, after collectstatic.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import BASE_DIR, CACHES, DATABASES, MIDDLEWARE
+
+DEBUG = False
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',')
+CSRF_TRUSTED_ORIGINS = [o for o in os.environ.get('DJANGO_CSRF_TRUSTED_ORIGINS', '').split(',') if o]
+
+SESSION_COOKIE_SECURE = os.environ.get('DJANGO_SECURE_COOKIES', '1') == '1'
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+
+# Database
+# DB_POOL=1 (default): a psycopg connection pool per worker process, sized to its
+# threads. DB_POOL=0: plain persistent connections (e.g. behind pgbouncer). Either
+# way connections are health checked before reuse (on pool checkout with a pool).
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if os.environ.get('DB_POOL', '1') == '1':
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # the pool keeps the connections
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', int(os.environ.get('WEB_THREADS', 4)) + 2)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'max_idle': 300,
+            'max_lifetime': 1800,
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+
+# Cache
+# Shared between all processes (gunicorn workers, run_workers, the sweeper,
+# manage.py commands): cached fragments, their version counters and the facet
+# cube only stay coherent when every process reads and bumps the same
+# counters. Redis by default (CACHE_LOCATION=redis://redis:6379/0, the compose
+# service); a per-process or file-based cache is refused at startup.
+
+CACHES['default']['BACKEND'] = os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache')
+CACHES['default']['LOCATION'] = os.environ.get('CACHE_LOCATION', 'redis://redis:6379/0')
+CACHES['default'].pop('OPTIONS', None)
+if CACHES['default']['BACKEND'].rsplit('.', 1)[-1] in ('LocMemCache', 'FileBasedCache', 'DummyCache'):
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND={CACHES['default']['BACKEND']} isn't shared between processes (or has no atomic incr); "
+        "use django.core.cache.backends.redis.RedisCache or PyMemcacheCache"
+    )
+
+# Static and media
+# collectstatic writes content-hashed, gzip-precompressed files to STATIC_ROOT;
+# WhiteNoise serves the hashed names with a far-future immutable Cache-Control
+# (and the .gz variant when the client accepts it). deploy/nginx.conf serves the same
+# directory, and MEDIA_ROOT, when nginx fronts the app.
+
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'sakthi.storage.StaticFilesStorage'},
+}
+MIDDLEWARE = list(MIDDLEWARE)
+MIDDLEWARE.insert(MIDDLEWARE.index('django.middleware.security.SecurityMiddleware') + 1,
+                  'whitenoise.middleware.WhiteNoiseMiddleware')
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', '0') == '1'  # let Django serve uploads when nothing else does
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {'console': {'class': 'logging.StreamHandler'}},
+    'root': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO')},
+}
@@ -0,0 +1,15 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Hashed, precompressed static files. Templates reference a few assets that
+    are not checked in (noimage.png, logo.png, hero2.jpg); those render their
+    plain URL, as in development, instead of failing the whole page.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
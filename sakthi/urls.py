@@ -23,6 +23,10 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+from sakthi.metrics import metrics_view
+from products.images import DERIVED_DIR, derivative_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -39,6 +43,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     
     # Swagger UI
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
@@ -47,8 +52,22 @@ urlpatterns = [
     
     # app endpoints
     path('', include('accounts.urls')),
-    path("products/", include("products.urls"))
+    path("products/", include("products.urls")),
+    path("api/", include("products.api_urls")),
 ]
 
-# if settings.DEBUG:  # only serve in dev
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# resized image derivatives are rendered on first request, then served like any media file
+urlpatterns += [
+    path(f'{settings.MEDIA_URL.strip("/")}/{DERIVED_DIR}/<str:digest>/<str:filename>', derivative_view,
+         name='image_derivative'),
+]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+elif getattr(settings, 'SERVE_MEDIA', False):
+    # production without nginx in front (see deploy/nginx.conf): uploads are never
+    # rewritten in place, so let clients and proxies keep them for a month
+    urlpatterns += [
+        re_path(r'^media/(?P<path>.*)$', cache_control(public=True, max_age=60 * 60 * 24 * 30)(serve),
+                {'document_root': settings.MEDIA_ROOT}),
+    ]
\ No newline at end of file